@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+from datetime import datetime
+from collections import OrderedDict
+
+# Plots are drawn off screen. Never opens a window.
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+from gen_tools import Tools
+from main import FileSort
+from main_scan import Scanner
+from main_stats import FileDf, Plotter
+
+
+class TreeGenerator:
+    """
+    Reproducible synthetic folder trees. The same settings and seed always give the same folders, names, sizes,
+    and times. Files are sparse so large trees take almost no memory on tmpfs.
+    """
+    # Extension -> weight. '' for files without an extension.
+    EXTS = {'.jpg': 25, '.png': 10, '.txt': 15, '.pdf': 10, '.docx': 8, '.xlsx': 7, '.mp3': 5, '.mp4': 5,
+            '.zip': 5, '.csv': 5, '': 5}
+    KEYWORDS = ('flute', 'letter', 'humidity', 'conidia', 'jar', 'view')
+    WORDS = ('sample', 'image', 'scan', 'notes', 'data', 'plate', 'slide', 'report')
+    # Newest file time. Fixed so trees don't depend on when they are made.
+    LATEST = 1700000000
+
+    def __init__(self, files=1000, depth=3, fanout=4, exts=None, keyword_rate=0.3, time_spread=3 * 365,
+                 max_size=1024 ** 2, seed=0):
+        self.files = files
+        self.depth = depth
+        self.fanout = fanout
+        self.exts = exts or self.EXTS
+        self.keyword_rate = keyword_rate
+        # Days between the oldest and newest file.
+        self.time_spread = time_spread
+        self.max_size = max_size
+        self.seed = seed
+
+    def settings(self):
+        return {'files': self.files, 'depth': self.depth, 'fanout': self.fanout, 'exts': self.exts,
+                'keyword_rate': self.keyword_rate, 'time_spread': self.time_spread, 'max_size': self.max_size,
+                'seed': self.seed}
+
+    def folders(self, root):
+        # fanout subfolders in every folder down to depth levels.
+        folders, level = [root], [root]
+        for depth in range(self.depth):
+            level = [os.path.join(folder, f"folder{depth}_{i}") for folder in level for i in range(self.fanout)]
+            folders.extend(level)
+        return folders
+
+    def make(self, root):
+        rnd = random.Random(self.seed)
+        folders = self.folders(root)
+        for folder in folders:
+            os.makedirs(folder, exist_ok=True)
+        exts, weights = list(self.exts), list(self.exts.values())
+
+        for i in range(self.files):
+            words = [rnd.choice(self.WORDS), rnd.choice(self.WORDS)]
+            if rnd.random() < self.keyword_rate:
+                words[rnd.randrange(2)] = rnd.choice(self.KEYWORDS)
+            file_path = os.path.join(rnd.choice(folders), f"{'_'.join(words)}_{i}{rnd.choices(exts, weights)[0]}")
+            with open(file_path, 'wb') as file:
+                file.truncate(rnd.randint(0, self.max_size))
+            file_time = self.LATEST - rnd.uniform(0, self.time_spread * 86400)
+            os.utime(file_path, (file_time, file_time))
+        return len(folders)
+
+
+class Benchmark:
+    """
+    Times the sorter on generated trees at one or more scales. Wall and CPU time are both kept so I/O-bound
+    steps stand out. Results are written as JSON so runs can be compared.
+    """
+    SCALES = (1000, 100000, 1000000)
+    SETTINGS = OrderedDict([
+        ('File Type', (1, {'File Types': ['Image', 'Video', 'Audio', 'Text', 'PDF', 'Spreadsheet', 'Word Document',
+                                          'Archive']})),
+        ('Date', (2, {'Time Mode': 'Time Modified', 'Time Interval': 'Year',
+                      'Date Range': {'Starting Date': '01-01-1900', 'Ending Date': '12-31-2099'}})),
+        ('Keyword', (3, {'Ungrouped Keywords': ['flute', 'jar'], 'Samples': ['conidia', 'view']}))])
+
+    def __init__(self, folder=None, sort_settings=None, workers=1, **tree_settings):
+        self.folder = folder or self.default_folder()
+        self.sort_settings = sort_settings or self.SETTINGS
+        self.workers = workers
+        self.tree_settings = tree_settings
+
+    @staticmethod
+    def default_folder():
+        # tmpfs keeps disk speed out of the timings.
+        if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+            return '/dev/shm'
+        return tempfile.gettempdir()
+
+    @staticmethod
+    def _timed(results, name, files, func, *args, **kwargs):
+        wall, cpu = time.perf_counter(), time.process_time()
+        result = func(*args, **kwargs)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        results[name] = {'wall': round(wall, 4), 'cpu': round(cpu, 4),
+                         'files_per_s': round(files / wall, 1) if wall > 0 else None}
+        print(f"  {name}: {wall:.3f} s wall, {cpu:.3f} s cpu", file=sys.stderr)
+        return result
+
+    def run_scale(self, files):
+        generator = TreeGenerator(files=files, **self.tree_settings)
+        root = tempfile.mkdtemp(prefix=f"bench{files}_", dir=self.folder)
+        results = {}
+        start_dir = os.getcwd()
+        print(f"{files:,} files in ({root})", file=sys.stderr)
+        try:
+            self._timed(results, 'make_tree', files, generator.make, root)
+            self._timed(results, 'get_file_count', files, Tools.get_file_count, root, [])
+
+            entries = [(entry, os.path.dirname(os.path.relpath(entry.path, root))) for entry in Scanner.scan(root)]
+            file_df = FileDf()
+            self._timed(results, 'store_file_properties', files,
+                        lambda: [file_df.store_file_properties(entry, folder) for entry, folder in entries])
+            df = self._timed(results, 'build_df', files, file_df.build_df)
+            plotter = Plotter(df=df, counter={}, total_chkd=len(entries))
+            self._timed(results, 'plotter_stats', files, plotter.stats)
+
+            sorter = FileSort(path=root)
+            self._timed(results, 'sort_files', files, sorter.sort_files, sort_settings=self.sort_settings,
+                        workers=self.workers)
+            # Same trees and settings always move the same files. A changed count means the runs differ.
+            results['sort_files']['moves'] = sorter.results.get('Moves Planned')
+            self._timed(results, 'unpack_folders', files, sorter.unpack_folders, dest=root, workers=self.workers)
+        finally:
+            # FileSort changed into the tree.
+            os.chdir(start_dir)
+            shutil.rmtree(root, ignore_errors=True)
+        return results
+
+    def run(self, scales=SCALES):
+        # The sorter's own messages and timings are kept out of stdout.
+        with contextlib.redirect_stdout(sys.stderr):
+            # Imports pandas so the import isn't timed as part of the first scale.
+            FileDf().build_df()
+            results = {str(files): self.run_scale(files) for files in scales}
+        return {'Started': datetime.now().isoformat(timespec='seconds'), 'Python': platform.python_version(),
+                'Platform': platform.platform(), 'Folder': self.folder, 'Workers': self.workers,
+                # One tree per scale. Same settings otherwise.
+                'Tree': {**TreeGenerator(**self.tree_settings).settings(), 'files': list(scales)},
+                'Settings': self.sort_settings,
+                'Results': results}
+
+    @staticmethod
+    def compare(old, new):
+        """
+        Wall time of each step in new as a ratio of old. Below 1 is faster.
+        """
+        ratios = {}
+        for scale, steps in new['Results'].items():
+            old_steps = old['Results'].get(scale, {})
+            ratios[scale] = {step: round(timing['wall'] / old_steps[step]['wall'], 3)
+                             for step, timing in steps.items() if old_steps.get(step, {}).get('wall')}
+        return ratios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='bench.py', description="Time the sorter on generated folder trees.")
+    parser.add_argument('--scales', type=int, nargs='+', default=list(Benchmark.SCALES), help="File counts.")
+    parser.add_argument('--folder', help="Where trees are made. Defaults to /dev/shm (tmpfs) when available.")
+    parser.add_argument('--out', help="JSON results file. Defaults to bench_<date>.json.")
+    parser.add_argument('--compare', help="Earlier results file to compare against.")
+    parser.add_argument('--settings', help="JSON or TOML sort settings. Same format as cli.py.")
+    parser.add_argument('--workers', type=int, default=1, help="Concurrent moves.")
+    parser.add_argument('--depth', type=int, default=3, help="Folder levels.")
+    parser.add_argument('--fanout', type=int, default=4, help="Subfolders per folder.")
+    parser.add_argument('--exts', help="Extension weights as JSON. Ex. '{\".jpg\": 3, \".txt\": 1}'")
+    parser.add_argument('--keyword-rate', type=float, default=0.3, help="Share of names with a keyword.")
+    parser.add_argument('--time-spread', type=int, default=3 * 365, help="Days between oldest and newest file.")
+    parser.add_argument('--max-size', type=int, default=1024 ** 2, help="Largest file in bytes. Files are sparse.")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    sort_settings = None
+    if args.settings:
+        from cli import load_settings
+        sort_settings = load_settings(args.settings)
+    # FileSort changes into the tree. Paths are resolved first.
+    for arg in ('folder', 'compare'):
+        if getattr(args, arg):
+            setattr(args, arg, os.path.abspath(getattr(args, arg)))
+    out = os.path.abspath(args.out or f"bench_{datetime.strftime(datetime.today(), '%m_%d_%y_%H_%M_%S')}.json")
+    benchmark = Benchmark(folder=args.folder, sort_settings=sort_settings, workers=args.workers, depth=args.depth,
+                          fanout=args.fanout, exts=json.loads(args.exts) if args.exts else None,
+                          keyword_rate=args.keyword_rate, time_spread=args.time_spread, max_size=args.max_size,
+                          seed=args.seed)
+    report = benchmark.run(args.scales)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as old_file:
+            report['Compared To'] = {'File': args.compare,
+                                     'Wall Ratio': Benchmark.compare(json.load(old_file), report)}
+    with open(out, 'w', encoding='utf-8') as out_file:
+        json.dump(report, out_file, indent=2)
+    print(json.dumps({'Results': out, **{key: report[key] for key in ('Results', 'Compared To') if key in report}}))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+Headless entry point. Never imports Qt or matplotlib.
+
+    python cli.py sort FOLDER --settings settings.json [--dry-run] [--manifest out.jsonl]
+    python cli.py apply MANIFEST
+    python cli.py unpack FOLDER
+    python cli.py revert FOLDER [--clear]
+    python cli.py watch FOLDER --settings settings.toml
+
+Settings use the same layout as SorterUI.sort_settings. Each category maps to [position, settings] or to a table
+with a 'position' key. Ex.
+    {"Keyword": [1, {"Non-Pictures": ["Flute", "Letter"], "Ungrouped Keywords": ["jar"]}]}
+A JSON summary is printed to stdout. Everything else goes to stderr.
+"""
+import os
+import sys
+import json
+import signal
+import time
+import argparse
+import traceback
+import contextlib
+from collections import OrderedDict
+
+
+def load_settings(settings_path):
+    if settings_path.endswith('.toml'):
+        import tomllib
+        with open(settings_path, 'rb') as settings_file:
+            raw_settings = tomllib.load(settings_file)
+    else:
+        with open(settings_path, encoding='utf-8') as settings_file:
+            raw_settings = json.load(settings_file, object_pairs_hook=OrderedDict)
+
+    sort_settings = OrderedDict()
+    for categ, value in raw_settings.items():
+        if isinstance(value, dict):
+            value = dict(value)
+            sort_settings[categ] = (value.pop('position'), value)
+        else:
+            sort_settings[categ] = tuple(value)
+    return sort_settings
+
+
+def _sort(args):
+    from main import FileSort
+
+    sort_settings = load_settings(args.settings)
+    if args.concurrency and (len(args.folder) > 1 or args.index or args.resume or args.log or args.profile or
+                             args.trace):
+        return {'Error': "--concurrency sorts one folder without --index, --resume, --log, --profile, or --trace."}
+    if len(args.folder) > 1:
+        return _sort_roots(args, sort_settings)
+    sorter = FileSort(path=args.folder[0])
+    # Ctrl+C cancels like the GUI's cancel button so a checkpoint can be saved.
+    signal.signal(signal.SIGINT, lambda *_: setattr(sorter, '_shutdown', 1))
+    if args.concurrency:
+        from main_async import AsyncSort
+
+        AsyncSort(sorter, args.concurrency).sort_files(sort_settings, ignore=args.ignore, in_place=args.in_place,
+                                                       dry_run=args.dry_run, manifest_path=args.manifest,
+                                                       sniff=args.sniff, dedupe=args.dedupe)
+    else:
+        sorter.sort_files(sort_settings=sort_settings, ignore=args.ignore, in_place=args.in_place,
+                          log_sort=args.log, dry_run=args.dry_run, manifest_path=args.manifest, workers=args.workers,
+                          index_path=args.index, resume=args.resume, sniff=args.sniff, dedupe=args.dedupe,
+                          profile=args.profile, trace_path=args.trace)
+    return {'Dry Run': args.dry_run, 'Manifest': args.manifest, **sorter.results}
+
+
+def _sort_roots(args, sort_settings):
+    from main import FileSort
+
+    if args.manifest or args.index or args.trace:
+        return {'Error': "--manifest, --index, and --trace can only be used when sorting one folder."}
+    sorter = FileSort()
+    signal.signal(signal.SIGINT, lambda *_: setattr(sorter, '_shutdown', 1))
+    results = sorter.sort_roots(args.folder, sort_settings, processes=args.processes, ignore=args.ignore,
+                                in_place=args.in_place, log_sort=args.log, dry_run=args.dry_run,
+                                workers=args.workers, resume=args.resume, sniff=args.sniff, dedupe=args.dedupe,
+                                profile=args.profile)
+    summary = {'Dry Run': args.dry_run, **results}
+    if failed := [root for root, result in results['Roots'].items() if 'Error' in result]:
+        summary['Error'] = f"Sort failed in {failed}."
+    return summary
+
+
+def _apply(args):
+    from main import FileSort
+    from main_manifest import SortManifest
+    from main_journal import MoveJournal
+
+    # Files may have changed since the manifest was written.
+    manifest, dropped = SortManifest.read(args.manifest).revalidated()
+    sorter = FileSort(path=manifest.path)
+    if dropped:
+        sorter.counter['Sorted']['Skipped'] += dropped
+    # Recorded like a sort so it can be reverted.
+    journal = MoveJournal.create(manifest.path)
+    try:
+        sorter.apply_manifest(manifest, workers=args.workers, journal=journal)
+    finally:
+        journal.close()
+    return {'Counter': {categ: dict(counts) for categ, counts in sorter.counter.items()}}
+
+
+def _unpack(args):
+    from main import FileSort
+
+    sorter = FileSort(path=args.folder)
+    sorter.unpack_folders(dest=args.dest or sorter.path, ignore=args.ignore)
+    return {'Counter': {categ: dict(counts) for categ, counts in sorter.counter.items()}}
+
+
+def _revert(args):
+    from main import FileSort
+    from main_journal import MoveJournal
+
+    if args.clear:
+        return {'Journals Removed': MoveJournal.prune(args.folder, keep=0)}
+    sorter = FileSort(path=args.folder)
+    journals = [MoveJournal(args.journal)] if args.journal else MoveJournal.journals(sorter.path)
+    # Newest first so sorts made on top of each other are undone in order.
+    for journal in journals if args.all or args.journal else journals[:1]:
+        sorter.revert_sort(journal=journal, workers=args.workers)
+    if not journals:
+        return {'Error': "No sort to revert."}
+    return {'Counter': {categ: dict(counts) for categ, counts in sorter.counter.items()}}
+
+
+def _watch(args):
+    from main import FileSort
+    from main_watch import SortWatcher
+
+    sort_settings = load_settings(args.settings)
+    sorter = FileSort(path=args.folder)
+    watcher = SortWatcher(sorter, sort_settings, settle=args.settle, in_place=args.in_place,
+                          workers=args.workers, use_inotify=not args.poll, sniff=args.sniff)
+
+    def report(manifest):
+        # One JSON line per batch of sorted files.
+        print(json.dumps({'Sorted': [[source, dest] for source, dest, _ in manifest]}), file=sys.__stdout__,
+              flush=True)
+
+    try:
+        watcher.run(on_sort=report)
+    except KeyboardInterrupt:
+        pass
+    return {'Counter': {categ: dict(counts) for categ, counts in sorter.counter.items()}}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="Sort files by date, file type, and keyword.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sort_cmd = commands.add_parser('sort', help="Sort one or more folders.")
+    sort_cmd.add_argument('folder', nargs='+', help="Folders given together are sorted in parallel processes.")
+    sort_cmd.add_argument('--settings', required=True, help="JSON or TOML sort settings.")
+    sort_cmd.add_argument('--ignore', nargs='*', default=None,
+                          help="Folders or glob patterns (ex. '*.git') to skip with everything under them.")
+    sort_cmd.add_argument('--in-place', action='store_true', help="Sort within each folder.")
+    sort_cmd.add_argument('--dry-run', action='store_true', help="Plan the sort without moving anything.")
+    sort_cmd.add_argument('--manifest', help="Write the planned moves to this file.")
+    sort_cmd.add_argument('--index', help="SQLite index for incremental re-sorts.")
+    sort_cmd.add_argument('--workers', type=int, default=1, help="Concurrent moves.")
+    sort_cmd.add_argument('--log', action='store_true', help="Write a sort log.")
+    sort_cmd.add_argument('--resume', action='store_true',
+                          help="Checkpoint the sort and continue an interrupted one with the same settings.")
+    sort_cmd.add_argument('--sniff', action='store_true', help="Detect file types of unknown extensions by content.")
+    sort_cmd.add_argument('--dedupe', choices=('report', 'skip', 'link'),
+                          help="Find files with the same content. Report them, leave copies unsorted, or replace "
+                               "copies with hard links.")
+    sort_cmd.add_argument('--profile', action='store_true',
+                          help="Add wall time, CPU time, and calls of each stage of the sort to the summary.")
+    sort_cmd.add_argument('--trace', help="Write the time taken for each file in each stage to this file.")
+    sort_cmd.add_argument('--concurrency', type=int, default=None,
+                          help="Use the asyncio engine with this many file operations in flight. For network "
+                               "drives where each operation is slow.")
+    sort_cmd.add_argument('--processes', type=int, default=None,
+                          help="Folders sorted at once when sorting several. Defaults to one per CPU.")
+    sort_cmd.set_defaults(func=_sort)
+
+    apply_cmd = commands.add_parser('apply', help="Apply a manifest written by a dry run.")
+    apply_cmd.add_argument('manifest')
+    apply_cmd.add_argument('--workers', type=int, default=1, help="Concurrent moves.")
+    apply_cmd.set_defaults(func=_apply)
+
+    unpack_cmd = commands.add_parser('unpack', help="Move all nested files into one folder.")
+    unpack_cmd.add_argument('folder')
+    unpack_cmd.add_argument('--dest', help="Folder to unpack into. Defaults to the folder itself.")
+    unpack_cmd.add_argument('--ignore', nargs='*', default=None,
+                            help="Folders or glob patterns (ex. '*.git') to skip with everything under them.")
+    unpack_cmd.set_defaults(func=_unpack)
+
+    revert_cmd = commands.add_parser('revert', help="Undo the last sort of a folder using its journal.")
+    revert_cmd.add_argument('folder')
+    revert_cmd.add_argument('--journal', help="Journal of the sort to revert. Defaults to the last sort.")
+    revert_cmd.add_argument('--all', action='store_true', help="Revert every sort not yet reverted, newest first.")
+    revert_cmd.add_argument('--workers', type=int, default=1, help="Concurrent moves.")
+    revert_cmd.add_argument('--clear', action='store_true',
+                            help="Delete every journal of the folder instead of reverting. Only the newest 20 are "
+                                 "kept otherwise.")
+    revert_cmd.set_defaults(func=_revert)
+
+    watch_cmd = commands.add_parser('watch', help="Sort files as they arrive in a folder.")
+    watch_cmd.add_argument('folder')
+    watch_cmd.add_argument('--settings', required=True, help="JSON or TOML sort settings.")
+    watch_cmd.add_argument('--in-place', action='store_true', help="Sort within each folder.")
+    watch_cmd.add_argument('--settle', type=float, default=2.0, help="Seconds without changes before sorting.")
+    watch_cmd.add_argument('--workers', type=int, default=1, help="Concurrent moves.")
+    watch_cmd.add_argument('--poll', action='store_true', help="Poll instead of using inotify.")
+    watch_cmd.add_argument('--sniff', action='store_true', help="Detect file types of unknown extensions by content.")
+    watch_cmd.set_defaults(func=_watch)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # FileSort changes the working directory so paths given relative to it are resolved first.
+    for arg in ('folder', 'settings', 'manifest', 'index', 'dest', 'journal', 'trace'):
+        if isinstance(value := getattr(args, arg, None), list):
+            setattr(args, arg, [os.path.abspath(path) for path in value])
+        elif value:
+            setattr(args, arg, os.path.abspath(value))
+    if getattr(args, 'ignore', None):
+        # Glob patterns are matched as given.
+        args.ignore = [item if set('*?[').intersection(item) else os.path.abspath(item) for item in args.ignore]
+    start = time.perf_counter()
+    # Messages printed by the sorter go to stderr so stdout only holds the summary.
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            summary = args.func(args)
+        except Exception as err:
+            traceback.print_exc()
+            summary = {'Error': f"{type(err).__name__}: {err}"}
+    summary = {'Command': args.command, **summary, 'Elapsed': round(time.perf_counter() - start, 3)}
+    print(json.dumps(summary, default=str))
+    return 1 if 'Error' in summary else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,27 @@
-from PyQt5.QtWidgets import QFrame
 import os
 import time
-import traceback
+import functools
+import importlib
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported the first time one of its attributes is used.
+    Keeps heavy dependencies (pandas, matplotlib) out of short sort jobs that never build stats or plots.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"LazyModule({self._name!r}, {state})"
 
 
 class Tools:
@@ -13,26 +33,22 @@ class Tools:
 
     @staticmethod
     def time_func(func):
+        # Wall time so time spent waiting on the disk is counted. Errors are left to the caller.
+        @functools.wraps(func)
         def timer(*args, **kwargs):
-            start = time.process_time()
-            try:
-                result = func(*args, **kwargs)
-            except Exception as e:
-                print(e)
-                print(traceback.print_exc())
-            else:
-                end = time.process_time()
-                print(f"Time elapsed for {func.__name__}: {round(end - start, 3)} seconds\n")
-                return result
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            print(f"Time elapsed for {func.__name__}: {round(time.perf_counter() - start, 3)} seconds\n")
+            return result
 
         return timer
 
     @staticmethod
     def get_file_count(path, ignored_dirs):
-        return sum(
-            [len(files) if root.replace("\\", "/") not in ignored_dirs else -len(files) for root, _, files in
-             os.walk(path)])
-        # Root is formatted weirdly in os.walk().
+        # Imported here as main_scan isn't needed for the GUI helpers.
+        from main_scan import Scanner, IgnoreRules
+        # Ignored folders and everything under them are never entered.
+        return sum(len(files) for _, files in Scanner.walk(path, ignore=IgnoreRules(ignored_dirs)))
 
     @staticmethod
     def get_base_folder(main_path, path):
@@ -51,6 +67,8 @@ class Tools:
     def create_seperator():
         # From user kaveish.
         # https://stackoverflow.com/questions/10053839/how-does-designer-create-a-line-widget/10469098
+        # Imported here so non-GUI code can use Tools without Qt.
+        from PyQt5.QtWidgets import QFrame
         line = QFrame()
         line.setFrameShape(QFrame.HLine)
         line.setFrameShadow(QFrame.Sunken)
@@ -2,9 +2,11 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtCore import Qt, QObject, QThread, pyqtSignal
 import sys
 import os
+import traceback
 from collections import OrderedDict
 
-from main import FileSort, Tools
+from main import FileSort
+from main_journal import MoveJournal
 from gui_widgets import SettingsList, KeywordTable, FileTypeButtons, DateButtons
 from gui_menu import MenuUI
 from gui_multidir import getExistingDirectories
@@ -28,6 +30,16 @@ class SorterUI(QMainWindow, FileSort):
         self.in_place = False
         self.show_data = True
         self.log_sort = True
+        # Read the first bytes of files with unknown extensions to find their file type.
+        self.sniff = False
+        # Concurrent moves during a sort.
+        self.workers = 4
+        # Copies of files with the same content are left where they are. Only the oldest is sorted.
+        self.skip_dups = False
+        # Canceled sorts continue where they stopped when run again with the same settings.
+        self.resume = True
+        # Folders sorted at once when sorting several. None for one per CPU.
+        self.processes = None
 
         # Main window or frame for all child widgets. vvv
         self.central_widg = QWidget()
@@ -131,18 +143,39 @@ class SorterUI(QMainWindow, FileSort):
         if len(self.sort_settings) == 0:
             return QMessageBox(QMessageBox.Warning, "Error: No Settings", "Unable to sort without settings.").exec_()
 
-        max_val = Tools.get_file_count(self.path, self.ignored_dirs)
-
         # Making instance of class allows to remain in scope. Otherwise, thread destroyed after end of code block.
         self.sec_thread = QThread()
 
         sort_prog = FuncProgress(desc=("Sort Progress", "Sort in progress..."),
                                  thread=self.sec_thread,
                                  sorter_obj=self,
-                                 maximum=max_val)
+                                 maximum=0)
 
         sort_prog._start_func(sort_settings=self.sort_settings, ignore=self.ignored_dirs,
-                              in_place=self.in_place, show_data=self.show_data, log_sort=self.log_sort)
+                              in_place=self.in_place, show_data=self.show_data, log_sort=self.log_sort,
+                              workers=self.workers, resume=self.resume, sniff=self.sniff,
+                              dedupe='skip' if self.skip_dups else None)
+
+    def _start_multi_sort(self):
+        if len(self.sort_settings) == 0:
+            return QMessageBox(QMessageBox.Warning, "Error: No Settings", "Unable to sort without settings.").exec_()
+
+        file_prompt = getExistingDirectories()
+        file_prompt.setWindowTitle("Select folders to sort.")
+        if not file_prompt.exec_() or not (roots := file_prompt.selectedFiles()):
+            return
+
+        # Each folder is sorted in its own process. Progress is combined into one bar.
+        self.sec_thread = QThread()
+        multi_prog = FuncProgress(desc=("Sort Progress", f"Sorting {len(roots)} folders..."),
+                                  thread=self.sec_thread,
+                                  sorter_obj=self,
+                                  maximum=0,
+                                  func_name='sort_roots')
+        multi_prog._start_func(roots, sort_settings=self.sort_settings, ignore=self.ignored_dirs,
+                               in_place=self.in_place, log_sort=self.log_sort, workers=self.workers,
+                               resume=self.resume, sniff=self.sniff, dedupe='skip' if self.skip_dups else None,
+                               processes=self.processes)
 
     def _start_unpack(self):
         if self.path is None:
@@ -150,23 +183,56 @@ class SorterUI(QMainWindow, FileSort):
 
         unpack_msg = QMessageBox(QMessageBox.Warning,
                                  "Warning: Begin Unpack?",
-                                 "Moves ALL nested files into current directory and DELETES ALL directories.\n"
+                                 "Moves ALL nested files into current directory and DELETES ALL emptied directories.\n"
+                                 "Files with a name already taken are renamed. Ex. 'img.png' -> 'img (1).png'\n"
                                  f"Current directory: {self.path}",
                                  QMessageBox.Ok | QMessageBox.Cancel)
         unpack_msg.setDefaultButton(QMessageBox.Ok)
         if unpack_msg.exec_() == QMessageBox.Cancel:
             return
 
-        self.unpack_folders(dest=self.path, ignore=self.ignored_dirs)
-        QMessageBox(QMessageBox.Information, "Notice: Unpack Completed", "Folder was unpacked successfully.").exec_()
+        # Runs in the background like a sort.
+        self.sec_thread = QThread()
+        unpack_prog = FuncProgress(desc=("Unpack Progress", "Unpack in progress..."),
+                                   thread=self.sec_thread,
+                                   sorter_obj=self,
+                                   maximum=0,
+                                   func_name='unpack_folders',
+                                   end_msgs=FuncProgress.UNPACK_END_MSGS)
+        unpack_prog._start_func(dest=self.path, ignore=self.ignored_dirs, workers=self.workers)
+
+    def _start_revert(self):
+        # Journals are kept in the sorted folder. Never guessed.
+        if self.path is None:
+            return QMessageBox(QMessageBox.Information, "Notice: No Folder Selected",
+                               "Select the sorted folder to revert first.").exec_()
 
-    def _end_sort(self, num):
+        revert_msg = QMessageBox(QMessageBox.Warning,
+                                 "Warning: Revert Last Sort?",
+                                 "Moves files from the last sort back to where they were and DELETES the empty "
+                                 "folders it made.\n"
+                                 f"Current directory: {self.path}",
+                                 QMessageBox.Ok | QMessageBox.Cancel)
+        revert_msg.setDefaultButton(QMessageBox.Ok)
+        if revert_msg.exec_() == QMessageBox.Cancel:
+            return
+        if not MoveJournal.journals(self.path):
+            return QMessageBox(QMessageBox.Information, "Notice: Nothing to Revert",
+                               "No sort to revert in folder.").exec_()
+
+        self.sec_thread = QThread()
+        revert_prog = FuncProgress(desc=("Revert Progress", "Revert in progress..."),
+                                   thread=self.sec_thread,
+                                   sorter_obj=self,
+                                   maximum=0,
+                                   func_name='revert_sort',
+                                   end_msgs=FuncProgress.REVERT_END_MSGS)
+        revert_prog._start_func(workers=self.workers)
+
+    def _end_func(self, num, end_msgs):
         # Messages need to be in main thread to work.
         self.sec_thread.exit()
-        if num == 1:
-            QMessageBox(QMessageBox.Information, "Notice: Sort Shutdown", "Sort was canceled prematurely.").exec_()
-        else:
-            QMessageBox(QMessageBox.Information, "Notice: Sort Completed", "Folder was successfully sorted.").exec_()
+        QMessageBox(QMessageBox.Information, *end_msgs[num]).exec_()
 
     def closeEvent(self, event):
         # Overwrite QWidget closeEvent.
@@ -179,22 +245,36 @@ class SorterUI(QMainWindow, FileSort):
 
 class FuncProgress(QObject):
     # Cannot be instance variables made after initializing.
-    progress_sig, fin_sig = pyqtSignal(int), pyqtSignal(int)
+    # progress_sig carries a main_progress.Progress report. Sent at most every ProgressMeter.INTERVAL seconds.
+    progress_sig, fin_sig = pyqtSignal(object), pyqtSignal(int)
+    # Total file count is only known once the sort has scanned the folder.
+    max_sig = pyqtSignal(int)
+
+    # Title and text shown when the function finishes. fin_sig(0) - finished, fin_sig(1) - canceled
+    SORT_END_MSGS = {0: ("Notice: Sort Completed", "Folder was successfully sorted."),
+                     1: ("Notice: Sort Shutdown", "Sort was canceled prematurely.")}
+    UNPACK_END_MSGS = {0: ("Notice: Unpack Completed", "Folder was unpacked successfully."),
+                       1: ("Notice: Unpack Shutdown", "Unpack was canceled prematurely.")}
+    REVERT_END_MSGS = {0: ("Notice: Revert Completed", "Sort was reverted."),
+                       1: ("Notice: Revert Shutdown", "Revert was canceled prematurely.")}
 
     # func has to emit a progress signal and a finished signal
-    def __init__(self, desc, thread, sorter_obj, maximum):
+    def __init__(self, desc, thread, sorter_obj, maximum, func_name='sort_files', end_msgs=SORT_END_MSGS):
         super().__init__()
         (self.title, self.desc) = desc
         self.prog_window = QProgressDialog(self.desc, "Cancel", 0, maximum)
         self._setup_prog_bar()
 
         self.sorter_obj = sorter_obj
-        self.sorter_func = getattr(sorter_obj, 'sort_files')
+        self.sorter_func = getattr(sorter_obj, func_name)
+        self.end_msgs = end_msgs
         self.thread = thread
         self.moveToThread(self.thread)
 
-        self.progress_sig.connect(self.prog_window.setValue)
-        self.fin_sig.connect(lambda num: self.sorter_obj._end_sort(num))
+        # Lambda so the update runs in the GUI thread and not the busy sorting thread this object is moved to.
+        self.progress_sig.connect(lambda report: self._update(report))
+        self.max_sig.connect(self.prog_window.setMaximum)
+        self.fin_sig.connect(lambda num: self.sorter_obj._end_func(num, self.end_msgs))
 
     def _setup_prog_bar(self):
         self.prog_window.setWindowModality(Qt.WindowModal)
@@ -203,9 +283,25 @@ class FuncProgress(QObject):
         self.prog_window.setMinimumDuration(0)
         self.prog_window.show()
 
+    def _update(self, report):
+        self.prog_window.setValue(report.files)
+        self.prog_window.setLabelText(f"{self.desc}\n{report}")
+
+    def _run_func(self, *args, **kwargs):
+        try:
+            self.sorter_func(*args, **kwargs)
+        except Exception:
+            # Ends like a canceled run so the progress dialog closes and the thread exits.
+            traceback.print_exc()
+            # Nothing of the failed run carries over to the next one.
+            self.sorter_obj._shutdown = 0
+            self.sorter_obj._reset()
+            self.fin_sig.emit(1)
+
     def _start_func(self, *args, **kwargs):
         kwargs['progress_sig'], kwargs['fin_sig'] = self.progress_sig, self.fin_sig
-        self.thread.started.connect(lambda: self.sorter_func(*args, **kwargs))
+        kwargs['max_sig'] = self.max_sig
+        self.thread.started.connect(lambda: self._run_func(*args, **kwargs))
 
         # Starting thread starts func.
         self.thread.start()
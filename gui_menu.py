@@ -39,7 +39,12 @@ class OptionsUI(QVBoxLayout):
                    "Log sort process": {'var_name': 'log_sort',
                                         'fx': lambda parent, btn: setattr(parent, 'log_sort', btn.isChecked())},
                    "Show folder data": {'var_name': 'show_data',
-                                        'fx': lambda parent, btn: setattr(parent, 'show_data', btn.isChecked())}}
+                                        'fx': lambda parent, btn: setattr(parent, 'show_data', btn.isChecked())},
+                   "Detect unknown file types": {'var_name': 'sniff',
+                                                 'fx': lambda parent, btn: setattr(parent, 'sniff', btn.isChecked())},
+                   "Leave duplicate files unsorted": {'var_name': 'skip_dups',
+                                                      'fx': lambda parent, btn: setattr(parent, 'skip_dups',
+                                                                                        btn.isChecked())}}
 
     def __init__(self, parent):
         super().__init__()
@@ -77,7 +82,9 @@ class OptionsUI(QVBoxLayout):
 class MenuUI(QMenuBar):
     MENU_ITEMS = {'General': {'Select Folder': '_choose_dir',
                               'Start Sort': '_prep_sort',
+                              'Sort Multiple Folders': '_start_multi_sort',
                               'Unpack Folder': '_start_unpack',
+                              'Revert Last Sort': '_start_revert',
                               'Ignore Folders': '_ignore_dirs',
                               'View Current Folder': '_open_file_loc',
                               'Quit': '_quit'},
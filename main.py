@@ -1,14 +1,34 @@
 import os
 import re
-import shutil
+import sys
 import mimetypes
 import logging
+import copy
+import json
+import time
+import queue
+import signal
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait
+from multiprocessing.managers import SyncManager
 from datetime import datetime
 from collections import Counter, defaultdict
 
 from main_stats import FileDf, Plotter
-from gui_stats import StatsUI
 from gen_tools import Tools
+from main_scan import Scanner, IgnoreRules
+from main_match import KeywordMatcher
+from main_manifest import SortManifest
+from main_transfer import Transfer
+from main_index import FileIndex
+from main_progress import Progress, ProgressMeter
+from main_checkpoint import Checkpoint
+from main_journal import MoveJournal
+from main_sniff import ContentSniffer
+from main_dedupe import DuplicateFinder
+from main_profile import StageProfiler
 
 
 class FolderFxs:
@@ -17,7 +37,7 @@ class FolderFxs:
                            {'subtype_patterns': ('text', 'msword', 'wordprocessingml'), 'categ': 'Word Document'},
                            {'subtype_patterns': ('presentation', 'ms-powerpoint', 'presentationml'),
                             'categ': 'Presentation'},
-                           {'subtype_patterns': ('pdf'), 'categ': 'PDF'},
+                           {'subtype_patterns': ('pdf',), 'categ': 'PDF'},
                            {'subtype_patterns': (
                                'x-7z-compressed', 'zip', 'x-tar', 'vnd.rar', 'java-archive', 'gzip', 'x-bzip',
                                'x-bzip2', 'x-freearc'),
@@ -27,14 +47,15 @@ class FolderFxs:
                       'image': {'subtype_patterns': (), 'categ': 'Image'},
                       'text': {'subtype_patterns': (), 'categ': 'Text'}}
 
-    TIME_MODES = {'Time Created': lambda file: os.stat(file).st_ctime,
-                  'Time Modified': lambda file: os.stat(file).st_mtime,
-                  'Time Accessed': lambda file: os.stat(file).st_atime}
+    # Read from the stat result cached on each FileEntry.
+    TIME_MODES = {'Time Created': lambda stat_obj: stat_obj.st_ctime,
+                  'Time Modified': lambda stat_obj: stat_obj.st_mtime,
+                  'Time Accessed': lambda stat_obj: stat_obj.st_atime}
     TIME_INTERVALS = {'Day': lambda datetime_obj: f'{datetime_obj.month}_{datetime_obj.day}_{datetime_obj.year}',
                       'Month': lambda datetime_obj: f'{datetime_obj.month}_{datetime_obj.year}',
                       'Year': lambda datetime_obj: f'{datetime_obj.year}'}
 
-    def __init__(self, sort_settings):
+    def __init__(self, sort_settings, sniff=False):
         # Dict of tuples where index 0 is the order pos and index 1 holds the desired settings.
         self.sort_settings = sort_settings
         self.sort_results = defaultdict(Counter)
@@ -42,31 +63,48 @@ class FolderFxs:
         # (pos, {Time Mode: ?, Time Interval: ?, Date Range: {Date start: ?, date end: ?})})
         if 'Date' in sort_settings:
             self.date_settings = sort_settings["Date"][1]
+            # Settings looked up and dates parsed once rather than per file.
+            self.time_mode = self.TIME_MODES[self.date_settings['Time Mode']]
+            self.time_interval = self.TIME_INTERVALS[self.date_settings['Time Interval']]
+            self.date_start = datetime.strptime(self.date_settings['Date Range']['Starting Date'], "%m-%d-%Y")
+            self.date_end = datetime.strptime(self.date_settings['Date Range']['Ending Date'], "%m-%d-%Y")
 
         # (pos, {Desc: ['Spreadsheet', 'Word Document', 'Presentation', 'PDF', 'Audio', 'Video', 'Image', 'Text', 'Archive']})
         if 'File Type' in sort_settings:
-            self.ftype_settings = list(sort_settings['File Type'][1].values())[1]
+            self.ftype_settings = [ftype for ftypes in sort_settings['File Type'][1].values() for ftype in ftypes]
+            # Extension -> category (or None). Filled lazily and shared for the whole sort.
+            self.ext_categs = {}
+            # Extensions mimetypes doesn't know. Files with these are sniffed if enabled.
+            self.unknown_exts = set()
+            self.sniffer = ContentSniffer() if sniff else None
 
         # (pos, {'Folder Name': [keywords], 'Ungrouped Keywords': []})
         if 'Keyword' in sort_settings:
             self.keyword_settings = sort_settings['Keyword'][1]
+            # All keyword groups compiled once per sort.
+            self.keyword_matcher = KeywordMatcher(self.keyword_settings)
 
-    def _date_folder(self, filename):
-        datetime_obj = datetime.fromtimestamp(self.TIME_MODES[self.date_settings['Time Mode']](filename))
+    def _date_folder(self, entry):
+        datetime_obj = datetime.fromtimestamp(self.time_mode(entry.stat))
 
-        start = datetime.strptime(self.date_settings['Date Range']['Starting Date'], "%m-%d-%Y")
-        end = datetime.strptime(self.date_settings['Date Range']['Ending Date'], "%m-%d-%Y")
-
-        if start < datetime_obj < end:
+        if self.date_start < datetime_obj < self.date_end:
             self.sort_results['Valid Date']['Valid'] += 1
-            return self.TIME_INTERVALS[self.date_settings['Time Interval']](datetime_obj)
+            return self.time_interval(datetime_obj)
         else:
             # Date not within range.
             self.sort_results['Valid Date']['Invalid'] += 1
             return None
 
-    def _file_folder(self, filename):
-        mtype, subtype = mimetypes.guess_type(filename)[0].split('/')
+    @staticmethod
+    def _ext_key(filename):
+        base, ext = os.path.splitext(filename)
+        # Compressed files keep their inner extension since mimetypes uses it. Ex. .tar.gz
+        if ext.lower() in mimetypes.encodings_map:
+            ext = os.path.splitext(base)[1] + ext
+        return ext
+
+    def _classify_mimetype(self, mimetype):
+        mtype, subtype = mimetype.split('/')
         # Ex. Word doc - ['application', 'msword']
 
         if isinstance(ftype_descs := self.FILE_MTYPE_KEY.get(mtype, None), tuple):
@@ -77,37 +115,51 @@ class FolderFxs:
                 # Return the categ as a string to be made into a folder.
                 if any(re.search(pattern, subtype) for pattern in ftype['subtype_patterns']) and \
                         ftype['categ'] in self.ftype_settings:
-                    self.sort_results["File Types"][ftype['categ']] += 1
                     return ftype['categ']
         elif isinstance(ftype_descs, dict):
             if ftype_descs['categ'] in self.ftype_settings:
-                self.sort_results["File Types"][ftype_descs['categ']] += 1
                 return ftype_descs['categ']
+        return None
+
+    def _classify_ext(self, ext):
+        # Only depends on the extension and ftype_settings. Called once per extension by _file_folder.
+        if (mimetype := mimetypes.guess_type(f"file{ext}")[0]) is not None:
+            if (categ := self._classify_mimetype(mimetype)) is not None:
+                return categ
         else:
-            if ftype_descs is None:
-                raise Exception("Unknown mimetype.")
-
-            # Custom file extension
-            for ftype in self.ftype_settings:
-                if re.search(ftype, os.path.splitext(filename)[1]):
-                    self.sort_results["File Types"][ftype] += 1
-                    return ftype
-
-    def _keyword_folder(self, filename):
-        for folder, words in self.keyword_settings.items():
-            # Increments self.file_counter if match found and returns keyword. Othewise, returns None.
-            word_finder = [Tools.counter_incrementor(self.sort_results['Keywords'], keyword, 1)
-                           for keyword in words
-                           if re.search(keyword, filename, re.IGNORECASE)]
-            if folder != 'Ungrouped Keywords':
-                # If any item in list comp has value, return folder.
-                if any(word_finder):
-                    return folder
-            elif folder == 'Ungrouped Keywords':
-                # If a file name contains multiple matching keywords, the last keyword will contain the file.
-                # This is because any found keywords will be nested into a single path and the LAST keyword is
-                # returned as the destination in _create_folders
-                return word_finder
+            self.unknown_exts.add(ext)
+
+        # Unknown mimetype or no category. Custom file extension
+        for ftype in self.ftype_settings:
+            if re.search(ftype, ext):
+                return ftype
+        return None
+
+    def _file_folder(self, entry):
+        ext = self._ext_key(entry.name)
+        try:
+            categ = self.ext_categs[ext]
+        except KeyError:
+            categ = self.ext_categs[ext] = self._classify_ext(ext)
+        # Extension lookup failed. Only then is the file's content read.
+        if categ is None and self.sniffer is not None and ext in self.unknown_exts:
+            if (mimetype := self.sniffer.mimetype(entry)) is not None:
+                categ = self._classify_mimetype(mimetype)
+
+        if categ is not None:
+            self.sort_results["File Types"][categ] += 1
+        return categ
+
+    def _keyword_folder(self, entry):
+        # Returns the first folder group with a match. If 'Ungrouped Keywords' is reached first, returns all of
+        # its matching keywords instead. Othewise, returns None.
+        # If a file name contains multiple matching ungrouped keywords, the last keyword will contain the file.
+        # This is because any found keywords will be nested into a single path and the LAST keyword is
+        # returned as the destination in _create_folders
+        folder, found = self.keyword_matcher.match(entry.path)
+        for keyword, times in found:
+            self.sort_results['Keywords'][keyword] += times
+        return folder
 
     def _order_fxs(self):
         # Callable functions.
@@ -115,64 +167,434 @@ class FolderFxs:
                         'File Type': self._file_folder,
                         'Keyword': self._keyword_folder}
 
-        # Order of function operations.
-        return [folder_names.get(option[0]) for option in sorted(self.sort_settings.items(), key=lambda x: x[1])]
+        # Order of function operations. Sorted by position only.
+        return [folder_names.get(option[0])
+                for option in sorted(self.sort_settings.items(), key=lambda x: int(x[1][0]))]
+
+
+class SortPlan:
+    """
+    Sort settings checked and compiled once into a single classifier.
+    Calling the plan with a FileEntry returns its folder names in sort order.
+    Lookup tables (keyword matcher, extension categories) are kept between sorts. Only the results are reset.
+    """
+    CATEGS = ('Date', 'File Type', 'Keyword')
+
+    def __init__(self, sort_settings, sniff=False):
+        self.check_settings(sort_settings)
+        # Copy so that later edits to the settings (ex. in the GUI) can be detected.
+        self.sort_settings = copy.deepcopy(sort_settings)
+        # File types of files with unknown extensions read from their content.
+        self.sniff = sniff
+        self.folder_fxs = FolderFxs(self.sort_settings, sniff)
+        self.folder_order = tuple(self.folder_fxs._order_fxs())
+        # Category names in the same order. Ex. ('Date', 'Keyword')
+        self.categs = tuple(sorted(self.sort_settings, key=lambda categ: int(self.sort_settings[categ][0])))
+
+    @classmethod
+    def check_settings(cls, sort_settings):
+        if len(sort_settings) == 0:
+            raise ValueError("No sort settings given.")
+        if unknown := [categ for categ in sort_settings if categ not in cls.CATEGS]:
+            raise ValueError(f"Unknown sort categories: {unknown}")
+
+        try:
+            positions = [int(pos) for pos, _ in sort_settings.values()]
+        except (TypeError, ValueError):
+            raise ValueError(f"Sort settings must be (position, settings) pairs: {dict(sort_settings)}")
+        if len(set(positions)) != len(positions):
+            raise ValueError(f"Sort positions must be unique: {positions}")
+
+    @property
+    def sort_results(self):
+        return self.folder_fxs.sort_results
+
+    def reset(self):
+        self.folder_fxs.sort_results = defaultdict(Counter)
+
+    def profiled(self, profiler):
+        """
+        Copy of the plan with each folder function timed by a StageProfiler. Shares lookup tables and results.
+        """
+        plan = copy.copy(self)
+        plan.folder_order = tuple(profiler.wrap(f"classify {categ}", fx, per_file=True)
+                                  for categ, fx in zip(self.categs, self.folder_order))
+        return plan
+
+    def __call__(self, entry):
+        return [fx(entry) for fx in self.folder_order]
 
 
 class FileSort(FileDf):
+    # Moves handed to a worker at a time.
+    MOVE_BATCH = 64
+    # Moves made between checkpoint saves of the apply phase.
+    CHECKPOINT_MOVES = 4096
 
     def __init__(self, path=None):
         super().__init__()
         self.path = path
         self.counter = defaultdict(Counter)
         self._shutdown = 0  # 0 for non-issue
+        # Folders already planned or known to exist during a sort. Avoids an os.path.isdir call per file.
+        self._known_dirs = set()
+        # Last compiled SortPlan. Reused while the sort settings stay the same.
+        self._plan = None
+        # Number of files in each folder they ended up in during a sort.
+        self.dest_tally = Counter()
+        # Summary of the last sort.
+        self.results = {}
+        # Kept between sorts so files hashed once aren't read again.
+        self._dup_finder = DuplicateFinder()
+        # Times the stages of a sort. Disabled unless sort_files is asked to profile.
+        self.profiler = StageProfiler()
         if path is not None:
             os.chdir(self.path)
 
         print(Tools.msg_creator(f"Current directory is {os.getcwd()}."))
 
-    def _create_folders(self, folder_order, dest):
+    @staticmethod
+    def _plan_folders(folder_order, dest):
+        # Builds the nested folder paths for a file. Last entry in the list will be destination.
         final_paths = []
-        if all(option is None or option == [] for option in folder_order):
-            # All options unfilled. Return None.
-            return None
-        else:
-            for folder in folder_order:
-                if isinstance(folder, list):
-                    for item in folder:
-                        if item is not None:
-                            dest = os.path.join(dest, item)
-                            final_paths.append(dest)
-                else:
-                    if folder is not None:
-                        # Start path needs to be changed to nest dirs as we loop through all dir names
-                        # and build on previous dir (start_path) made.
-                        dest = os.path.normpath(os.path.join(dest, folder))
+        for folder in folder_order:
+            if isinstance(folder, list):
+                for item in folder:
+                    if item is not None:
+                        dest = os.path.join(dest, item)
                         final_paths.append(dest)
+            else:
+                if folder is not None:
+                    # Start path needs to be changed to nest dirs as we loop through all dir names
+                    # and build on previous dir (start_path) made.
+                    dest = os.path.normpath(os.path.join(dest, folder))
+                    final_paths.append(dest)
+        return final_paths
+
+    def _get_plan(self, sort_settings, sniff=False):
+        if isinstance(sort_settings, SortPlan):
+            return sort_settings
+        if self._plan is None or self._plan.sort_settings != sort_settings or self._plan.sniff != sniff:
+            self._plan = SortPlan(sort_settings, sniff)
+        return self._plan
+
+    def _fingerprint(self, plan, ignore, in_place):
+        # Identifies a sort for the index and checkpoints. Both are thrown away if it changes.
+        return json.dumps([self.path, plan.sort_settings, ignore, in_place, plan.sniff], sort_keys=True)
+
+    def plan_sort(self, sort_settings, ignore=None, in_place=False, show_data=False, index=None, checkpoint=None,
+                  dedupe=None, folders=None, progress_sig=None, max_sig=None):
+        """
+        Read-only pass over the folder. Classifies every file and returns a SortManifest of the moves and folders
+        the sort would make.
+        With a FileIndex, unchanged folders aren't listed and unchanged files reuse their cached folder names.
+        With a loaded Checkpoint, planning continues from the moves and folders of the interrupted sort.
+        With dedupe, files with the same content are found before planning. See _find_duplicates.
+        With folders, a listing of (root, [FileEntry, ...]) in Scanner.walk order is planned instead of walking.
+        Files checked are reported through progress_sig like moves. The total (and ETA) is only known when the
+        listing is done up front (folders given or dedupe). Otherwise max_sig is sent 0.
+        """
+        plan = self._get_plan(sort_settings)
+        plan.reset()
+        # Folders of an earlier plan may never have been made.
+        self._known_dirs = set()
+        # Each stage is only wrapped when profiling. Otherwise the same functions are called directly.
+        profiler = self.profiler
+        if profiler.enabled:
+            plan = plan.profiled(profiler)
+        store_file_properties = profiler.wrap('stats', self.store_file_properties, per_file=True)
+        manifest = SortManifest(self.path)
+        # Names in each destination folder. One listing per destination to check for collisions.
+        dest_names = {}
+        if index is not None:
+            index.use_settings(self._fingerprint(plan, ignore, in_place))
+        if checkpoint is not None:
+            if checkpoint.manifest is None:
+                checkpoint.manifest = manifest
+            manifest = checkpoint.manifest
+            # Planned moves haven't been made so their names are added to the destination listings.
+            for source, dest, _ in manifest:
+                if dest not in dest_names:
+                    dest_names[dest] = set(os.listdir(dest)) if os.path.isdir(dest) else set()
+                dest_names[dest].add(os.path.basename(source))
+        # Ignored folders are pruned from the walk. Nothing under them is listed.
+        ignore = IgnoreRules(ignore)
+
+        # Single scan of the tree. Every file is stat'ed once and the entry is reused for the rest of the sort.
+        # Cancelling stops the walk itself, not just the current folder.
+        if folders is None:
+            folders = Scanner.walk(self.path, index=index, cancel=lambda: self._shutdown == 1,
+                                   checkpoint=checkpoint, ignore=ignore, profiler=profiler)
+            folders = profiler.wrap_iter('walk', folders)
+        if dedupe is not None:
+            # Every file has to be known before any is planned.
+            folders = profiler.wrap('dedupe', self._find_duplicates)(list(folders), dedupe, manifest, index)
+        total = sum(len(files) for _, files in folders) if isinstance(folders, list) else 0
+        if max_sig:
+            max_sig.emit(total)
+        meter = ProgressMeter(total, 0, progress_sig.emit if progress_sig else None, phase='plan')
+
+        for root, files in folders:
+            # Only checked between folders so a checkpoint never holds a partly planned folder.
+            if self._shutdown == 1:
+                break
+            destination = (root if in_place else self.path)
 
-            for path in final_paths:
-                if not os.path.exists(path):
-                    logging.info(f"Folder ({os.path.normpath(path)}) created.")
-                    os.makedirs(path)
-                    self.counter['Sorted']['Folders'] += 1
-
-            # Last entry in final_paths will be destination.
-            # Filenames with multiple keywords will be placed in the last keyword path.
-            return final_paths[-1]
-
-    @staticmethod
-    def _ignore_check(ign):
-        if isinstance(ign, list):
-            return set(ign)
-        elif isinstance(ign, str):
-            return {ign}
+            indexed = index.files_in(root) if index is not None and files else {}
+            for entry in files:
+                if show_data:
+                    store_file_properties(entry, root.replace(self.path, ""))
+                self.counter['Checked']['Files'] += 1
+                self._plan_entry(entry, plan, manifest, dest_names, destination, indexed.get(entry.name), index)
+                meter.advance()
+
+            if checkpoint is not None:
+                checkpoint.finish_dir(root)
+                if checkpoint.due():
+                    checkpoint.save(self.counter, self.dest_tally)
+
+        meter.finish()
+        return manifest
+
+    def _find_duplicates(self, folders, action, manifest, index=None):
+        """
+        Dedupe stage. Finds files with the same content among the (root, files) listed and keeps the oldest copy.
+        Other copies are counted and logged, then handled by action:
+            'report' - Sorted as usual.
+            'skip' - Left where they are. Only the kept copy is sorted.
+            'link' - Replaced by a hard link to the kept copy when the manifest is applied. Same device only.
+        Only files listed in this sort are compared. With a FileIndex, files in unchanged folders aren't.
+        Returns the folders left to plan.
+        """
+        if action not in DuplicateFinder.ACTIONS:
+            raise ValueError(f"Invalid dedupe action ({action}). Use one of {DuplicateFinder.ACTIONS}.")
+        groups = self._dup_finder.find((entry for _, files in folders for entry in files), index=index)
+
+        skipped = set()
+        for keep, *copies in groups:
+            for entry in copies:
+                self.counter['Duplicates']['Files'] += 1
+                self.counter['Duplicates']['Bytes'] += entry.stat.st_size
+                logging.info(f"({os.path.normpath(entry.path)}) is a duplicate of ({os.path.normpath(keep.path)}).")
+                if action == 'skip':
+                    skipped.add(entry.path)
+                    self.dest_tally[entry.root] += 1
+                # Already hard links of the same file. Nothing to save.
+                elif action == 'link' and entry.stat.st_dev == keep.stat.st_dev and \
+                        entry.stat.st_ino != keep.stat.st_ino:
+                    manifest.add_link(keep.path, entry.path)
+
+        if skipped:
+            folders = [(root, [entry for entry in files if entry.path not in skipped]) for root, files in folders]
+        return folders
+
+    def _plan_entry(self, entry, plan, manifest, dest_names, destination, cached=None, index=None):
+        # Folder order is a list of folder names created from the folder functions.
+        # Unchanged files since the last indexed sort skip classification.
+        if cached is not None and cached[0] == FileIndex.file_key(entry.stat):
+            folder_names = cached[1]
+            self.counter['Checked']['Unchanged'] += 1
         else:
-            return {None}
+            folder_names = plan(entry)
+
+        # All options unfilled if no paths.
+        if not (final_paths := self._plan_folders(folder_order=folder_names, dest=destination)):
+            self.dest_tally[entry.root] += 1
+            if index is not None:
+                index.add_file(entry.root, entry, folder_names)
+            return
+
+        for path in final_paths:
+            if path not in self._known_dirs:
+                self._known_dirs.add(path)
+                if not os.path.isdir(path):
+                    manifest.add_dir(path)
+
+        # Filenames with multiple keywords will be placed in the last keyword path.
+        final_dir = final_paths[-1]
+        if final_dir not in dest_names:
+            dest_names[final_dir] = set(os.listdir(final_dir)) if os.path.isdir(final_dir) else set()
+
+        # Avoid trying to move files from the currently checking root dir to itself
+        # and if file exists in final_dir.
+        if entry.root != final_dir and entry.name not in dest_names[final_dir]:
+            dest_names[final_dir].add(entry.name)
+            reason = ' / '.join(f"{categ}: {', '.join(name) if isinstance(name, list) else name}"
+                                for categ, name in zip(plan.categs, folder_names) if name)
+            manifest.add_move(entry.path, final_dir, reason, entry.stat.st_size)
+            if index is not None:
+                # Indexed at its destination only once moved.
+                index.add_move(entry, folder_names)
+        else:
+            # File stays where it is. Moved files are tallied once moved.
+            self.dest_tally[entry.root] += 1
+            if index is not None:
+                index.add_file(entry.root, entry, folder_names)
+
+    def plan_entries(self, entries, sort_settings, in_place=False, sniff=False):
+        """
+        Plans a sort of only the given FileEntry objects. Used to sort files as they arrive.
+        Sort results keep adding up until the plan is reset.
+        """
+        plan = self._get_plan(sort_settings, sniff)
+        manifest = SortManifest(self.path)
+        dest_names = {}
+        # Folders may have changed since the last call.
+        self._known_dirs = set()
+        for entry in entries:
+            self.counter['Checked']['Files'] += 1
+            self._plan_entry(entry, plan, manifest, dest_names, entry.root if in_place else self.path)
+        return manifest
+
+    def _move_batch(self, moves, moved, transfer, names):
+        for source, dest, _ in moves:
+            if self._shutdown == 1:
+                return
+            try:
+                dest_path = transfer.move(source, dest, names.get(source))
+            except OSError as err:
+                # Removed, locked, or name taken since planning. One file never stops the rest.
+                # An existing file is never replaced.
+                logging.info(f"({source}) not moved. {err}")
+                moved(source, None)
+                continue
+            # Ignored and no log made if logging.basicConfig not set. Can just leave in w/o conditional
+            logging.info(f"({os.path.basename(source)}) moved from ({os.path.dirname(source)}) to ({dest})")
+            moved(source, dest_path)
+
+    def _move_batches(self, moves):
+        # Moves grouped by destination folder in manifest order and split into batches.
+        # Names within a destination are unique after planning so batches never collide with each other.
+        by_dest = defaultdict(list)
+        for move in moves:
+            by_dest[move[1]].append(move)
+        return [moves[i:i + self.MOVE_BATCH] for moves in by_dest.values()
+                for i in range(0, len(moves), self.MOVE_BATCH)]
+
+    def _link_duplicate(self, target, path):
+        # Linked beside the copy then swapped in. The copy is never missing if this fails partway.
+        temp_path = f"{path}.{os.getpid()}.link"
+        try:
+            os.link(target, temp_path)
+            os.replace(temp_path, path)
+        except OSError as err:
+            logging.info(f"({os.path.normpath(path)}) not linked. {err}")
+            if os.path.lexists(temp_path):
+                os.remove(temp_path)
+            return
+        logging.info(f"({os.path.normpath(path)}) linked to ({os.path.normpath(target)}).")
+        self.counter['Duplicates']['Linked'] += 1
+
+    def apply_manifest(self, manifest, progress_sig=None, max_sig=None, workers=1, checkpoint=None, journal=None,
+                       categ='Sorted', index=None):
+        """
+        Makes all folders in the manifest, replaces duplicates with hard links, then moves its files.
+        With more than one worker, moves run concurrently in a thread pool of that size.
+        Moves are made in windows of CHECKPOINT_MOVES. With a Checkpoint, the number of moves made is saved after
+        each window.
+        With a MoveJournal, every folder made and file moved is recorded so the sort can be reverted.
+        With a FileIndex, files are indexed where they end up.
+        Folders made and files moved are counted under categ.
+        """
+        if max_sig:
+            max_sig.emit(len(manifest))
+
+        makedirs = self.profiler.wrap('makedirs', os.makedirs)
+        for path in manifest.dirs:
+            if self._shutdown == 1:
+                return
+            try:
+                makedirs(path)
+            except FileExistsError:
+                # Made by an interrupted sort.
+                continue
+            logging.info(f"Folder ({os.path.normpath(path)}) created.")
+            self.counter[categ]['Folders'] += 1
+            if journal is not None:
+                journal.add_dir(path)
+
+        for target, path in manifest.links:
+            if self._shutdown == 1:
+                return
+            self._link_duplicate(target, path)
+
+        lock = threading.Lock()
+        # Rename on the same device. Kernel-side copy across devices.
+        transfer = Transfer()
+        transfer.move = self.profiler.wrap('move', transfer.move, per_file=True)
+
+        # Progress reports (files/s, bytes/s, ETA) sent at most every ProgressMeter.INTERVAL seconds.
+        meter = ProgressMeter(len(manifest), manifest.total_size, progress_sig.emit if progress_sig else None)
+
+        def moved(source, dest_path):
+            # dest_path is None for a file left where it is.
+            with lock:
+                if dest_path is None:
+                    self.counter[categ]['Skipped'] += 1
+                    if os.path.lexists(source):
+                        self.dest_tally[os.path.dirname(source)] += 1
+                    if index is not None:
+                        index.skipped(source)
+                else:
+                    if journal is not None:
+                        journal.add_move(source, dest_path)
+                    if index is not None:
+                        index.moved(source, dest_path)
+                    self.counter[categ]['Files'] += 1
+                    self.dest_tally[os.path.dirname(dest_path)] += 1
+                meter.advance(manifest.sizes[source])
+
+        try:
+            for start in range(0, len(manifest), self.CHECKPOINT_MOVES):
+                window = manifest.moves[start:start + self.CHECKPOINT_MOVES]
+                if workers <= 1:
+                    self._move_batch(window, moved, transfer, manifest.names)
+                else:
+                    self._move_concurrent(window, moved, transfer, workers, manifest.names)
+                if self._shutdown == 1:
+                    break
+                if checkpoint is not None:
+                    checkpoint.applied = start + len(window)
+                    if checkpoint.due():
+                        checkpoint.save(self.counter, self.dest_tally)
+        finally:
+            meter.finish()
+
+    def _move_concurrent(self, moves, moved, transfer, workers, names):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._move_batch, batch, moved, transfer, names)
+                       for batch in self._move_batches(moves)]
+            try:
+                for future in as_completed(futures):
+                    # Raises any error from the worker.
+                    future.result()
+                    if self._shutdown == 1:
+                        break
+            finally:
+                # Batches not yet started are dropped on cancel or error.
+                for future in futures:
+                    future.cancel()
 
     # TODO: Implement show data functionality
     @Tools.time_func
-    def sort_files(self, sort_settings, progress_sig=None, fin_sig=None,
-                   ignore=None, in_place=False, show_data=False, log_sort=False):
+    def sort_files(self, sort_settings, progress_sig=None, fin_sig=None, max_sig=None,
+                   ignore=None, in_place=False, show_data=False, log_sort=False, dry_run=False, manifest_path=None,
+                   workers=1, index_path=None, resume=False, journal=True, sniff=False, dedupe=None, profile=False,
+                   trace_path=None):
+        """
+        With resume, progress is checkpointed in the folder's state folder and a sort interrupted by a cancel,
+        error, or crash continues where it stopped the next time it's run with the same settings.
+        With journal, moves are recorded in the folder's state folder so the sort can be undone with revert_sort.
+        With sniff, files with an extension unknown to mimetypes are sorted by file type using their first bytes.
+        With dedupe ('report', 'skip', or 'link'), files with the same content are found before planning.
+        Hashes are cached in the index when there is one.
+        With profile, wall time, CPU time, and calls of each stage are added to the results under 'Profile'.
+        With trace_path, the time taken for each file in each per-file stage is also written there as JSON lines.
+        """
+        plan = self._get_plan(sort_settings, sniff)
+        # Left over if the last sort failed partway.
+        self._reset()
+        profiler = self.profiler = StageProfiler(profile, trace_path)
 
         if log_sort:
             print('Logging sort.')
@@ -181,46 +603,56 @@ class FileSort(FileDf):
                                 format="%(asctime)s - %(message)s", datefmt="%b-%d-%y %H:%M:%S",
                                 level=logging.INFO)
             logging.info(f"Sort started in ({os.path.normpath(self.path)}).")
-            logging.info(f"Parameters: {dict(sort_settings)}")
+            logging.info(f"Parameters: {dict(plan.sort_settings)}")
             logging.info(f"Ignored folders: {ignore}")
-            logging.info(f"Sorting in-place: {in_place}\n")
-
-        ignore = self._ignore_check(ignore)
-        folder_fxs = FolderFxs(sort_settings)
-        folder_order = folder_fxs._order_fxs()
-
-        for root, dirs, files in os.walk(self.path, topdown=False):
-            root = os.path.normpath(root)
-            destination = (root if in_place else self.path)
-
-            # Check if sorting in one of the ignored dirs. Skip if root dir matches one of the ignored dirs.
-            if any([os.path.samefile(item, root) if item else False for item in ignore]):
-                logging.info(f'*Skipped sorting ({root}).')
+            logging.info(f"Sorting in-place: {in_place}")
+            logging.info(f"Duplicates: {dedupe}")
+            logging.info(f"Dry run: {dry_run}\n")
+
+        # Incremental sort. Only new or changed files are classified and moved.
+        index = FileIndex(index_path) if index_path else None
+        checkpoint = Checkpoint(self.path, self._fingerprint(plan, ignore, in_place)) if resume else None
+        if checkpoint is not None and checkpoint.load():
+            logging.info(f"Resuming interrupted sort ({checkpoint.phase} phase).")
+            for categ, counts in checkpoint.counter.items():
+                self.counter[categ].update(counts)
+            self.dest_tally.update(checkpoint.dest_tally)
+        move_journal = None
+
+        try:
+            if checkpoint is not None and checkpoint.phase == 'apply':
+                manifest = checkpoint.remaining()
             else:
-                for file in files:
-                    if self._shutdown == 1:
-                        break
-                    if show_data:
-                        self.store_file_properties(os.path.join(root, file), root.replace(self.path, ""))
-
-                    # Folder order is a list of folder names created from the folder functions.
-                    # create_folders creates a list of folders (+paths) and returns the last folder as the destination path.
-                    folder_names = [fx(filename=os.path.join(root, file)) for fx in folder_order]
-                    final_dir = self._create_folders(folder_order=folder_names, dest=destination)
-
-                    # Avoid trying to move files from the currently checking root dir to itself
-                    # and if no folder created
-                    # and if file exists in final_dir.
-                    if root != final_dir and final_dir is not None and not os.path.exists(os.path.join(final_dir, file)):
-                        # Ignored and no log made if logging.basicConfig not set. Can just leave in w/o conditional
-                        logging.info(f"({file}) moved from ({root}) to ({final_dir})")
-                        shutil.move(os.path.join(root, file), final_dir)
-                        self.counter['Sorted']['Files'] += 1
-
-                    # Counter which is used to signal that a file has been sorted and ProgressBar must be updated.
-                    self.counter['Checked']['Files'] += 1
-                    if progress_sig:
-                        progress_sig.emit(self.counter['Checked']['Files'])
+                # Plan phase. Nothing is moved until the manifest is applied.
+                manifest = self.plan_sort(plan, ignore=ignore, in_place=in_place, show_data=show_data, index=index,
+                                          checkpoint=checkpoint, dedupe=dedupe, progress_sig=progress_sig,
+                                          max_sig=max_sig)
+            if manifest_path:
+                logging.info(f"Manifest written to ({manifest.write(manifest_path)}).")
+            if not dry_run and self._shutdown == 0:
+                if checkpoint is not None:
+                    checkpoint.start_apply(manifest, self.counter, self.dest_tally)
+                if journal:
+                    move_journal = MoveJournal.create(self.path)
+                self.apply_manifest(manifest, progress_sig=progress_sig, max_sig=max_sig, workers=workers,
+                                    checkpoint=checkpoint, journal=move_journal, index=index)
+                if index is not None and self._shutdown == 0:
+                    index.save()
+            if checkpoint is not None and self._shutdown == 0:
+                checkpoint.clear()
+                checkpoint = None
+        finally:
+            # Later calls outside a sort (ex. the watcher) aren't profiled.
+            profiler.close()
+            self.profiler = StageProfiler()
+            if index is not None:
+                index.close()
+            if move_journal is not None:
+                move_journal.close()
+            # Canceled, or failed while moving. Saved so the next sort picks up from here.
+            # Errors while planning keep the last periodic save which always ends on a fully planned folder.
+            if checkpoint is not None and (checkpoint.phase == 'apply' or self._shutdown == 1):
+                checkpoint.save(self.counter, self.dest_tally)
 
         # Signal that sorting is finished to ProgressBar
         # fin_sig(1) - emergency shutdown, fin_sig(0) - normal shutdown
@@ -230,37 +662,255 @@ class FileSort(FileDf):
         if log_sort:
             logging.info(shutdown_msg[self._shutdown])
             logging.info(f"{dict(self.counter)}")
+            if profiler.enabled:
+                logging.info(f"Profile:\n{profiler}")
             logging.shutdown()
         if show_data:
-            graph = Plotter(df=self.df, counter=folder_fxs.sort_results, total_chkd=self.counter['Checked']['Files'])
+            graph = Plotter(df=self.df, counter=plan.sort_results, total_chkd=self.counter['Checked']['Files'])
             # graph_ui = StatsUI()
             # graph.csize_time()
             # graph.file_ext()
 
-            graph.file_dist(self.path)
+            graph.file_dist(self.folder_dist())
             # graph.file_types()
             # graph.file_time_valid()
 
-        # Reset dataframe, shutdown, and counter.
+        self._end_sort(plan, manifest)
+        if profiler.enabled:
+            self.results['Profile'] = profiler.report()
+        return manifest
+
+    def _end_sort(self, plan, manifest):
+        # Kept after the reset for callers like the CLI.
+        self.results = {'Counter': {categ: dict(counts) for categ, counts in self.counter.items()},
+                        'Sort Results': {categ: dict(counts) for categ, counts in plan.sort_results.items()},
+                        'Folders Planned': len(manifest.dirs), 'Moves Planned': len(manifest),
+                        'Canceled': bool(self._shutdown)}
+
         self._shutdown = 0
+        self._reset()
+
+    def _reset(self):
+        # Reset dataframe, counter, and folders known during a sort.
         super().__init__()
         self.counter = defaultdict(Counter)
+        self._known_dirs = set()
+        self.dest_tally = Counter()
+
+    def sort_roots(self, roots, sort_settings, progress_sig=None, fin_sig=None, max_sig=None, processes=None,
+                   **sort_kwargs):
+        """
+        Sorts several folders with the same settings. Each folder is sorted by sort_files in its own process with
+        up to processes folders sorted at once (one per CPU by default).
+        Progress of all folders is sent as one combined report. Results are merged into self.results with the
+        results of each folder under 'Roots'.
+        Takes the options of sort_files except show_data, manifest_path, and index_path which are for one folder.
+        """
+        # Resolved before any worker changes its working directory.
+        roots, merged = self._merge_roots([os.path.abspath(root) for root in roots])
+        latest = {}
+        # Forking a process with other threads running (ex. the GUI's) can copy held locks. Workers start fresh.
+        mp_context = multiprocessing.get_context('spawn')
+        mp_manager = SyncManager(ctx=mp_context)
+        mp_manager.start(_ignore_interrupt)
+        try:
+            reports, cancel = mp_manager.Queue(), mp_manager.Event()
+            with ProcessPoolExecutor(max_workers=processes, mp_context=mp_context,
+                                     initializer=_ignore_interrupt) as executor:
+                futures = {executor.submit(_sort_root, root, sort_settings, sort_kwargs, reports, cancel): root
+                           for root in roots}
+                start, total, pending = time.monotonic(), 0, set(futures)
+                while pending:
+                    _, pending = wait(pending, timeout=ProgressMeter.INTERVAL)
+                    if self._shutdown == 1 and not cancel.is_set():
+                        # Running sorts stop at their next check. Folders not yet started are dropped.
+                        cancel.set()
+                        for future in pending:
+                            future.cancel()
+
+                    updated = False
+                    try:
+                        while True:
+                            root, report = reports.get_nowait()
+                            latest[root], updated = report, True
+                    except queue.Empty:
+                        pass
+                    if updated:
+                        combined = Progress.combine(list(latest.values()), time.monotonic() - start)
+                        if max_sig and combined.total != total:
+                            total = combined.total
+                            max_sig.emit(total)
+                        if progress_sig:
+                            progress_sig.emit(combined)
+        finally:
+            mp_manager.shutdown()
+
+        results = {root: {'Merged Into': outer} for root, outer in merged.items()}
+        for future, root in futures.items():
+            if future.cancelled():
+                results[root] = {'Canceled': True}
+                continue
+            try:
+                results[root] = future.result()
+            except Exception as err:
+                results[root] = {'Error': f"{type(err).__name__}: {err}"}
+
+        counter, sort_results = defaultdict(Counter), defaultdict(Counter)
+        for result in results.values():
+            for categ, counts in result.get('Counter', {}).items():
+                counter[categ].update(counts)
+            for categ, counts in result.get('Sort Results', {}).items():
+                sort_results[categ].update(counts)
+        self.results = {'Counter': {categ: dict(counts) for categ, counts in counter.items()},
+                        'Sort Results': {categ: dict(counts) for categ, counts in sort_results.items()},
+                        'Folders Planned': sum(result.get('Folders Planned', 0) for result in results.values()),
+                        'Moves Planned': sum(result.get('Moves Planned', 0) for result in results.values()),
+                        'Canceled': bool(self._shutdown), 'Roots': results}
 
-    @Tools.time_func
-    def unpack_folders(self, dest, ignore=None):
-        ignore = self._ignore_check(ignore)
+        if fin_sig:
+            fin_sig.emit(self._shutdown)
+        self._shutdown = 0
+        return self.results
 
-        for root, dirs, files in os.walk(self.path, topdown=False):
-            if any([os.path.samefile(item, root) if item else False for item in ignore]):
-                print(f'*Skipped unpacking {root}.\n')
+    @staticmethod
+    def _merge_roots(roots):
+        """
+        Roots to sort in separate processes and {root: outer root} for the rest. A root given twice or inside
+        another root is sorted with that root so no file is moved by two processes.
+        """
+        outer_roots, merged = {}, {}
+        # Shortest first so outer roots are kept before the roots inside them.
+        for root in sorted(roots, key=lambda root: len(os.path.realpath(root))):
+            real_root = os.path.normcase(os.path.realpath(root))
+            for outer, real_outer in outer_roots.items():
+                if real_root == real_outer or real_root.startswith(real_outer.rstrip(os.sep) + os.sep):
+                    if root != outer:
+                        logging.info(f"({root}) is sorted with ({outer}).")
+                        merged[root] = outer
+                    break
             else:
-                if root != self.path:
-                    for file in files:
-                        shutil.move(os.path.join(root, file), dest)
-                        self.counter['Unpacked']['Files'] += 1
+                outer_roots[root] = real_root
+        return [root for root in dict.fromkeys(roots) if root in outer_roots], merged
+
+    def folder_dist(self):
+        """
+        Files per top-level folder after a sort. Taken from the tally kept during the sort so no walk is needed.
+        """
+        dir_file_count = Counter()
+        for folder, num_files in self.dest_tally.items():
+            rel_folder = os.path.relpath(folder, self.path)
+            # Files left in the main path aren't in a folder.
+            if rel_folder != os.curdir:
+                dir_file_count[rel_folder.split(os.sep)[0]] += num_files
+        # Convert to dict to avoid matplotlib errors with Counter object.
+        return dict(dir_file_count)
+
+    @Tools.time_func
+    def revert_sort(self, journal=None, progress_sig=None, fin_sig=None, max_sig=None, workers=1):
+        """
+        Undoes a sort by replaying its MoveJournal backwards. Defaults to the last sort not yet reverted.
+        Files are moved back with the same batched moves as a sort, then folders the sort made are removed if empty.
+        Only files in the journal are touched so the cost depends on the number of moves, not the size of the tree.
+        Files moved since the sort or whose original name has been taken are left where they are.
+        """
+        if journal is None:
+            if not (journals := MoveJournal.journals(self.path)):
+                print("No sort to revert.")
+                return None
+            journal = journals[0]
+        dirs, moves = journal.read()
+
+        manifest = SortManifest(self.path)
+        # Names in each original folder. One listing per folder so a file added since the sort is never replaced.
+        dest_names = {}
+        for source, dest in reversed(moves):
+            folder, name = os.path.split(source)
+            if folder not in dest_names:
+                dest_names[folder] = set(os.listdir(folder)) if os.path.isdir(folder) else set()
+                if not os.path.isdir(folder):
+                    manifest.add_dir(folder)
+            if name in dest_names[folder] or not os.path.lexists(dest):
+                logging.info(f"({dest}) not reverted. File moved or ({source}) exists.")
+                self.counter['Reverted']['Skipped'] += 1
+                continue
+            dest_names[folder].add(name)
+            manifest.add_move(dest, folder, 'Revert', name=name if name != os.path.basename(dest) else None)
+
+        self.apply_manifest(manifest, progress_sig=progress_sig, max_sig=max_sig, workers=workers, categ='Reverted')
+
+        if self._shutdown == 0:
+            # Deepest folders first. os.rmdir only removes empty dirs.
+            for folder in reversed(dirs):
+                try:
+                    os.rmdir(folder)
+                    self.counter['Reverted']['Removed Folders'] += 1
+                except OSError:
+                    continue
+            journal.mark_reverted()
+            # Moves of an interrupted sort no longer apply.
+            Checkpoint(self.path, None).clear()
+
+        if fin_sig:
+            fin_sig.emit(self._shutdown)
+        self._shutdown = 0
+        self.dest_tally = Counter()
+        return manifest
+
+    @staticmethod
+    def _free_name(name, names):
+        # Same name with a number added before the extension. Ex. 'img.png' -> 'img (1).png'
+        stem, ext = os.path.splitext(name)
+        num = 1
+        while (new_name := f"{stem} ({num}){ext}") in names:
+            num += 1
+        return new_name
+
+    @Tools.time_func
+    def unpack_folders(self, dest, ignore=None, progress_sig=None, fin_sig=None, max_sig=None, workers=1):
+        """
+        Moves all nested files into dest then removes the emptied folders bottom-up.
+        Files whose name is taken in dest are renamed. Ex. 'img.png' -> 'img (1).png'
+        Ignored folders are left as they are and so are their parents, which aren't empty.
+        """
+        manifest = SortManifest(self.path)
+        # Names already in dest. One listing. Never replace an existing file.
+        dest_names = set(os.listdir(dest))
+        dest_root = os.path.normpath(dest)
+        # Deepest first as given by the walk.
+        folders = []
+
+        for root, files in Scanner.walk(self.path, cancel=lambda: self._shutdown == 1, ignore=IgnoreRules(ignore)):
+            if self._shutdown == 1:
+                break
+            # Files already in dest stay put.
+            if root == self.path or root == dest_root:
+                continue
+            folders.append(root)
+            for entry in files:
+                name = entry.name
+                if name in dest_names:
+                    name = self._free_name(name, dest_names)
+                    logging.info(f"({entry.path}) renamed to ({name}). Name taken in ({dest}).")
+                dest_names.add(name)
+                manifest.add_move(entry.path, dest, 'Unpack', entry.stat.st_size,
+                                  name=name if name != entry.name else None)
+
+        self.apply_manifest(manifest, progress_sig=progress_sig, max_sig=max_sig, workers=workers, categ='Unpacked')
+
+        if self._shutdown == 0:
+            for folder in folders:
+                try:
                     # os.rmdir only removes empty dirs.
-                    os.rmdir(root)
+                    os.rmdir(folder)
                     self.counter['Unpacked']['Folders'] += 1
+                except OSError:
+                    logging.info(f"Folder ({folder}) not empty. Not removed.")
+
+        if fin_sig:
+            fin_sig.emit(self._shutdown)
+        self._shutdown = 0
+        self.dest_tally = Counter()
+        return manifest
 
     def __str__(self):
         if self.counter == {}:
@@ -269,6 +919,43 @@ class FileSort(FileDf):
             return Tools.msg_creator(f"{dict(self.counter)}")
 
 
+def _ignore_interrupt():
+    # Worker processes of FileSort.sort_roots are canceled through an event. Ctrl+C is left to the main process.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class _QueueSignal:
+    """
+    Stands in for a progress signal in a worker process. Reports are sent back tagged with the folder sorted.
+    """
+    def __init__(self, report_queue, key):
+        self.report_queue = report_queue
+        self.key = key
+
+    def emit(self, report):
+        self.report_queue.put((self.key, report))
+
+
+def _sort_root(path, sort_settings, sort_kwargs, reports, cancel):
+    # Runs in a worker process of FileSort.sort_roots. Its messages go to stderr so stdout is left to the caller.
+    with contextlib.redirect_stdout(sys.stderr):
+        sorter = FileSort(path=path)
+        done = threading.Event()
+
+        def watch_cancel():
+            while not done.wait(ProgressMeter.INTERVAL):
+                if cancel.is_set():
+                    sorter._shutdown = 1
+                    return
+
+        threading.Thread(target=watch_cancel, daemon=True).start()
+        try:
+            sorter.sort_files(sort_settings, progress_sig=_QueueSignal(reports, path), **sort_kwargs)
+        finally:
+            done.set()
+    return sorter.results
+
+
 if __name__ == '__main__':
     """
     --------------------------------------------------------------------------
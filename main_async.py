@@ -0,0 +1,169 @@
+import os
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from gen_tools import Tools
+from main_scan import Scanner, IgnoreRules
+from main_transfer import Transfer
+from main_progress import ProgressMeter
+from main_journal import MoveJournal
+
+
+class AsyncSort:
+    """
+    Sort engine for network filesystems (SMB/NFS) where every stat, listing, makedirs, and rename is a slow
+    round-trip. Blocking calls run in a thread pool of concurrency threads driven by one event loop, so that many
+    of them are in flight at once instead of one after another.
+        Scan - Folders are listed and their files stat'ed concurrently. Put back in Scanner.walk order.
+        Plan - Sequential with the sorter's own plan_sort. Same classification and same manifest as sort_files.
+        Apply - Each folder is made once its parent is. Files are moved as soon as their destination exists.
+    Index and checkpoints are only used by FileSort.sort_files.
+    """
+    CONCURRENCY = 32
+    # Files stat'ed per call in a large folder.
+    STAT_BATCH = 256
+
+    def __init__(self, sorter, concurrency=CONCURRENCY):
+        self.sorter = sorter
+        self.concurrency = concurrency
+        self._executor = None
+
+    async def _run(self, func, *args, **kwargs):
+        # Blocking call in the pool. The pool's size bounds how many are in flight.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def scan(self, root, ignore=None):
+        """
+        (root, [FileEntry, ...]) for root and every folder under it in the order of Scanner.walk.
+        """
+        if self.sorter._shutdown == 1:
+            return []
+        if (listing := await self._run(Scanner.list_dir, root, ignore, stat_files=False)) is None:
+            return []
+        entries, subdirs = listing
+
+        # Subfolders are listed while this folder's files are stat'ed.
+        batches = asyncio.gather(*(self._run(Scanner.stat_entries, root, entries[i:i + self.STAT_BATCH])
+                                   for i in range(0, len(entries), self.STAT_BATCH)))
+        *nested, stat_batches = await asyncio.gather(*(self.scan(subdir, ignore) for subdir in subdirs), batches)
+        folders = [folder for subdir_folders in nested for folder in subdir_folders]
+        folders.append((root, [entry for batch in stat_batches for entry in batch]))
+        return folders
+
+    async def apply(self, manifest, progress_sig=None, max_sig=None, journal=None):
+        """
+        Same result as FileSort.apply_manifest with up to concurrency folders made or files moved at once.
+        """
+        sorter = self.sorter
+        if max_sig:
+            max_sig.emit(len(manifest))
+
+        async def make_dir(path):
+            # Tasks for every folder exist before any runs so a parent made in this sort is always found.
+            if (parent := made.get(os.path.dirname(path))) is not None:
+                await parent
+            if sorter._shutdown == 1:
+                return
+            try:
+                await self._run(os.mkdir, path)
+            except FileExistsError:
+                return
+            except FileNotFoundError:
+                # Parent removed since planning.
+                await self._run(os.makedirs, path, exist_ok=True)
+            logging.info(f"Folder ({os.path.normpath(path)}) created.")
+            sorter.counter['Sorted']['Folders'] += 1
+            if journal is not None:
+                journal.add_dir(path)
+
+        made = {}
+        for path in manifest.dirs:
+            made[path] = asyncio.ensure_future(make_dir(path))
+
+        transfer = Transfer()
+        meter = ProgressMeter(len(manifest), manifest.total_size, progress_sig.emit if progress_sig else None)
+        # Shared by every mover. Each move is taken by exactly one.
+        moves = iter(manifest.moves)
+
+        async def mover():
+            for source, dest, _ in moves:
+                if (folder := made.get(dest)) is not None:
+                    await folder
+                if sorter._shutdown == 1:
+                    return
+                try:
+                    dest_path = await self._run(transfer.move, source, dest, manifest.names.get(source))
+                except OSError as err:
+                    # Removed, locked, or name taken since planning. One file never stops the rest.
+                    logging.info(f"({source}) not moved. {err}")
+                    sorter.counter['Sorted']['Skipped'] += 1
+                    if os.path.lexists(source):
+                        sorter.dest_tally[os.path.dirname(source)] += 1
+                    meter.advance(manifest.sizes[source])
+                    continue
+                logging.info(f"({os.path.basename(source)}) moved from ({os.path.dirname(source)}) to ({dest})")
+                # Back on the event loop thread. No lock needed.
+                if journal is not None:
+                    journal.add_move(source, dest_path)
+                sorter.counter['Sorted']['Files'] += 1
+                sorter.dest_tally[os.path.dirname(dest_path)] += 1
+                meter.advance(manifest.sizes[source])
+
+        tasks = list(made.values())
+        try:
+            # Duplicates are linked before any file is moved. Folders are made meanwhile.
+            for target, path in manifest.links:
+                if sorter._shutdown == 1:
+                    break
+                await self._run(sorter._link_duplicate, target, path)
+            tasks.extend(asyncio.ensure_future(mover()) for _ in range(self.concurrency))
+            await asyncio.gather(*tasks)
+        finally:
+            # Left over after a cancel or an error.
+            for task in tasks:
+                task.cancel()
+            meter.finish()
+
+    async def _sort(self, plan, progress_sig, max_sig, ignore, in_place, dry_run, manifest_path, journal, dedupe):
+        sorter = self.sorter
+        ignore = IgnoreRules(ignore)
+        root = os.path.normpath(sorter.path)
+        folders = [] if ignore and ignore.match_path(root) else await self.scan(root, ignore)
+
+        manifest = sorter.plan_sort(plan, in_place=in_place, dedupe=dedupe, folders=folders, progress_sig=progress_sig,
+                                    max_sig=max_sig)
+        if manifest_path:
+            logging.info(f"Manifest written to ({manifest.write(manifest_path)}).")
+        if not dry_run and sorter._shutdown == 0:
+            move_journal = MoveJournal.create(sorter.path) if journal else None
+            try:
+                await self.apply(manifest, progress_sig=progress_sig, max_sig=max_sig, journal=move_journal)
+            finally:
+                if move_journal is not None:
+                    move_journal.close()
+        return manifest
+
+    @Tools.time_func
+    def sort_files(self, sort_settings, progress_sig=None, fin_sig=None, max_sig=None, ignore=None, in_place=False,
+                   dry_run=False, manifest_path=None, journal=True, sniff=False, dedupe=None):
+        """
+        Sorts the sorter's folder like FileSort.sort_files. Results are left in the sorter's results.
+        """
+        plan = self.sorter._get_plan(sort_settings, sniff)
+        # Left over if the last sort failed partway.
+        self.sorter._reset()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            manifest = asyncio.run(self._sort(plan, progress_sig, max_sig, ignore, in_place, dry_run, manifest_path,
+                                              journal, dedupe))
+        finally:
+            self._executor.shutdown()
+            self._executor = None
+
+        if fin_sig:
+            fin_sig.emit(self.sorter._shutdown)
+        self.sorter._end_sort(plan, manifest)
+        return manifest
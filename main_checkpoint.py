@@ -0,0 +1,165 @@
+import os
+import json
+import time
+
+from main_scan import Scanner
+from main_manifest import SortManifest
+
+
+class Checkpoint:
+    """
+    Progress of an unfinished sort kept in the sorted folder's state folder so an interrupted sort can resume.
+    Plan phase: folders whose files were all planned (with their mtime), the moves planned so far, and counters.
+    Files in planned folders aren't checked again on resume unless the folder changed.
+    Apply phase: the manifest and how many of its moves were applied. Duplicate links are redone until a move is.
+    Folders and moves are appended to a log. A small state file, replaced atomically, records how much of the
+    log is valid so a crash while saving never leaves a broken checkpoint.
+    """
+    # Seconds between saves. Checkpoints are also saved on cancel and on errors.
+    SAVE_INTERVAL = 5.0
+    LOG_NAME = 'checkpoint.jsonl'
+    STATE_NAME = 'checkpoint.json'
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.folder = os.path.join(path, Scanner.STATE_DIR)
+        self.log_path = os.path.join(self.folder, self.LOG_NAME)
+        self.state_path = os.path.join(self.folder, self.STATE_NAME)
+        self.fingerprint = fingerprint
+        self.phase = 'plan'
+        self.applied = 0
+        self.manifest = None
+        self.counter = {}
+        self.dest_tally = {}
+        # Folder -> mtime for folders whose files were all planned.
+        self.planned_dirs = {}
+        self._listed = {}
+        self._new_planned = []
+        self._log_size = 0
+        self._saved_dirs = 0
+        self._saved_moves = 0
+        self._saved_links = 0
+        self._last_save = time.monotonic()
+
+    def load(self):
+        """
+        Loads a checkpoint left by an interrupted sort with the same settings. Returns False if there is none.
+        """
+        try:
+            with open(self.state_path, encoding='utf-8') as state_file:
+                state = json.load(state_file)
+            with open(self.log_path, 'rb') as log_file:
+                log = log_file.read(state['log_size']).decode('utf-8')
+        except (OSError, ValueError, KeyError):
+            return False
+        if state.get('fingerprint') != self.fingerprint:
+            return False
+
+        manifest = SortManifest(self.path)
+        for line in log.splitlines():
+            kind, *item = json.loads(line)
+            if kind == 'dir':
+                manifest.add_dir(item[0])
+            elif kind == 'move':
+                manifest.add_move(*item)
+            elif kind == 'link':
+                manifest.add_link(*item)
+            else:
+                self.planned_dirs[item[0]] = item[1]
+
+        self.manifest = manifest
+        self.phase, self.applied = state['phase'], state['applied']
+        self.counter, self.dest_tally = state['counter'], state['dest_tally']
+        self._log_size = state['log_size']
+        self._saved_dirs, self._saved_moves = len(manifest.dirs), len(manifest)
+        self._saved_links = len(manifest.links)
+        return True
+
+    def remaining(self):
+        """
+        Moves of a resumed apply phase not yet made. Moves made after the last save are dropped by checking
+        that their source still exists.
+        """
+        manifest = SortManifest(self.path)
+        for path in self.manifest.dirs:
+            manifest.add_dir(path)
+        # Links are made before any move.
+        if self.applied == 0:
+            for link in self.manifest.links:
+                manifest.add_link(*link)
+        for source, dest, reason in self.manifest.moves[self.applied:]:
+            if os.path.lexists(source):
+                manifest.add_move(source, dest, reason, self.manifest.sizes[source])
+        return manifest
+
+    def planned(self, root, mtime):
+        return self.planned_dirs.get(root) == mtime
+
+    def listed(self, root, mtime):
+        # mtime taken by the scanner before listing. Folder is only planned once all of its files are.
+        self._listed[root] = mtime
+
+    def finish_dir(self, root):
+        if (mtime := self._listed.pop(root, None)) is not None:
+            self.planned_dirs[root] = mtime
+            self._new_planned.append((root, mtime))
+
+    def due(self):
+        return time.monotonic() - self._last_save >= self.SAVE_INTERVAL
+
+    def start_apply(self, manifest, counter, dest_tally):
+        """
+        Replaces the plan log with the full manifest. Apply positions refer to this manifest.
+        """
+        self.manifest = manifest
+        self.phase, self.applied = 'apply', 0
+        self._log_size = self._saved_dirs = self._saved_moves = self._saved_links = 0
+        self._new_planned = []
+        self.save(counter, dest_tally)
+
+    def save(self, counter, dest_tally):
+        manifest = self.manifest
+        os.makedirs(self.folder, exist_ok=True)
+        lines = [json.dumps(['dir', path]) for path in manifest.dirs[self._saved_dirs:]]
+        lines.extend(json.dumps(['move', *move, manifest.sizes[move[0]]]) for move in manifest.moves[self._saved_moves:])
+        lines.extend(json.dumps(['link', *link]) for link in manifest.links[self._saved_links:])
+        lines.extend(json.dumps(['planned', root, mtime]) for root, mtime in self._new_planned)
+
+        with open(self.log_path, 'ab') as log_file:
+            # Anything past the last save was never recorded in the state file.
+            log_file.truncate(self._log_size)
+            if lines:
+                log_file.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            log_file.flush()
+            os.fsync(log_file.fileno())
+            log_size = log_file.tell()
+
+        state = {'fingerprint': self.fingerprint, 'phase': self.phase, 'applied': self.applied,
+                 'log_size': log_size, 'counter': {categ: dict(counts) for categ, counts in counter.items()},
+                 'dest_tally': dict(dest_tally)}
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as state_file:
+            json.dump(state, state_file)
+            state_file.flush()
+            os.fsync(state_file.fileno())
+        os.replace(temp_path, self.state_path)
+
+        self._log_size = log_size
+        self._saved_dirs, self._saved_moves = len(manifest.dirs), len(manifest)
+        self._saved_links = len(manifest.links)
+        self._new_planned = []
+        self._last_save = time.monotonic()
+
+    def clear(self):
+        """
+        Removes the checkpoint once the sort finishes. The state folder is removed if nothing else is in it.
+        """
+        for file_path in (self.state_path, self.log_path):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rmdir(self.folder)
+        except OSError:
+            pass
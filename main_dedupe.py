@@ -0,0 +1,118 @@
+import os
+import mmap
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DuplicateFinder:
+    """
+    Finds files with the same content in three passes so only likely duplicates are read in full.
+        1. Group by size.
+        2. Hash the first and last BLOCK bytes.
+        3. Hash the full content with mmap reads. Files are hashed in parallel.
+    Hashes are cached by (st_dev, st_ino, st_size, st_mtime_ns) in memory and, with a FileIndex, on disk so repeat
+    runs don't read unchanged files again. Hard links of the same file are only hashed once.
+    """
+    BLOCK = 64 * 1024
+    # Empty files aren't duplicates of each other.
+    MIN_SIZE = 1
+    WORKERS = min(8, os.cpu_count() or 1)
+    ACTIONS = ('report', 'skip', 'link')
+
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self.index = None
+        # File key -> [partial hash, full hash]
+        self._hashes = {}
+
+    @staticmethod
+    def file_key(stat_obj):
+        return stat_obj.st_dev, stat_obj.st_ino, stat_obj.st_size, stat_obj.st_mtime_ns
+
+    @classmethod
+    def _partial_hash(cls, entry):
+        size = entry.stat.st_size
+        digest = hashlib.blake2b(digest_size=16)
+        with open(entry.path, 'rb', buffering=0) as file:
+            digest.update(file.read(cls.BLOCK))
+            if size > cls.BLOCK:
+                file.seek(max(cls.BLOCK, size - cls.BLOCK))
+                digest.update(file.read(cls.BLOCK))
+        return digest.digest()
+
+    @staticmethod
+    def _full_hash(entry):
+        digest = hashlib.blake2b(digest_size=32)
+        with open(entry.path, 'rb') as file:
+            # hashlib releases the GIL for large buffers so threads hash in parallel.
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+        return digest.digest()
+
+    def _cached(self, key):
+        if (hashes := self._hashes.get(key)) is None:
+            hashes = self._hashes[key] = list(self.index.hashes(key)) if self.index is not None else [None, None]
+        return hashes
+
+    def _hash_all(self, entries, pos, hash_fx):
+        """
+        Hashes of entries for one pass (0 - partial, 1 - full). Only files not already cached are read.
+        Files that can't be read get None.
+        """
+        todo = {}
+        for entry in entries:
+            key = self.file_key(entry.stat)
+            if self._cached(key)[pos] is None:
+                todo.setdefault(key, entry)
+
+        def run(entry):
+            try:
+                return hash_fx(entry)
+            except (OSError, ValueError):
+                return None
+
+        if todo:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for key, digest in zip(todo, executor.map(run, todo.values())):
+                    self._hashes[key][pos] = digest
+                    if digest is not None and self.index is not None:
+                        self.index.add_hashes(key, *self._hashes[key])
+        return [self._hashes[self.file_key(entry.stat)][pos] for entry in entries]
+
+    def find(self, entries, index=None):
+        """
+        Groups of FileEntry objects with the same content. The oldest file (then path) is first in each group.
+        """
+        self.index = index
+        by_size = defaultdict(list)
+        for entry in entries:
+            if entry.stat.st_size >= self.MIN_SIZE:
+                by_size[entry.stat.st_size].append(entry)
+        candidates = [entry for group in by_size.values() if len(group) > 1 for entry in group]
+
+        by_partial = defaultdict(list)
+        for entry, digest in zip(candidates, self._hash_all(candidates, 0, self._partial_hash)):
+            if digest is not None:
+                by_partial[entry.stat.st_size, digest].append(entry)
+
+        groups, full_candidates = [], []
+        for (size, _), group in by_partial.items():
+            if len(group) < 2:
+                continue
+            # Both blocks already cover the whole file.
+            if size <= 2 * self.BLOCK:
+                groups.append(group)
+            else:
+                full_candidates.extend(group)
+
+        by_full = defaultdict(list)
+        for entry, digest in zip(full_candidates, self._hash_all(full_candidates, 1, self._full_hash)):
+            if digest is not None:
+                by_full[entry.stat.st_size, digest].append(entry)
+        groups.extend(group for group in by_full.values() if len(group) > 1)
+
+        if index is not None:
+            index.save_hashes()
+        self.index = None
+        return [sorted(group, key=lambda entry: (entry.stat.st_mtime_ns, entry.path)) for group in groups]
@@ -0,0 +1,132 @@
+import os
+import json
+import sqlite3
+
+
+class FileIndex:
+    """
+    On-disk index (SQLite) of a sorted folder used for incremental re-sorts.
+    Files are keyed by path with (device, inode, size, mtime) and their cached folder names.
+    Folders are stored with their mtime and subfolders so unchanged folders don't need to be listed again.
+    Everything is cleared if the sort settings change, except content hashes which only depend on the file.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS files (folder TEXT, name TEXT, dev INTEGER, ino INTEGER, size INTEGER,
+                                          mtime INTEGER, folders TEXT, PRIMARY KEY (folder, name));
+        CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime INTEGER, subdirs TEXT);
+        CREATE TABLE IF NOT EXISTS hashes (dev INTEGER, ino INTEGER, size INTEGER, mtime INTEGER, partial BLOB,
+                                           full BLOB, PRIMARY KEY (dev, ino));
+    """
+
+    def __init__(self, db_path):
+        if folder := os.path.dirname(db_path):
+            os.makedirs(folder, exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(self.SCHEMA)
+        # Folders listed and files checked during this sort. Only saved once the sort finishes.
+        self._seen_dirs = []
+        self._files = []
+        self._moved = []
+        self._hashes = []
+        # Source path -> (FileEntry, folder names) of files planned to move but not yet moved.
+        self._planned = {}
+        # Folders with a file that couldn't be moved. Listed again next sort.
+        self._stale_dirs = set()
+
+    @staticmethod
+    def file_key(stat_obj):
+        return stat_obj.st_dev, stat_obj.st_ino, stat_obj.st_size, stat_obj.st_mtime_ns
+
+    def use_settings(self, fingerprint):
+        """
+        Clears the index if it was made with different settings.
+        """
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()
+        if row is None or row[0] != fingerprint:
+            with self.conn:
+                self.conn.execute("DELETE FROM files")
+                self.conn.execute("DELETE FROM dirs")
+                self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('settings', ?)", (fingerprint,))
+
+    def unchanged_dir(self, path, mtime):
+        """
+        Returns the stored subfolders of path if its mtime is the same as the last sort. Otherwise, None.
+        """
+        row = self.conn.execute("SELECT mtime, subdirs FROM dirs WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == mtime:
+            return json.loads(row[1])
+        return None
+
+    def seen_dir(self, path, mtime, subdirs):
+        self._seen_dirs.append((path, mtime, json.dumps(subdirs)))
+
+    def files_in(self, folder):
+        """
+        {name: ((dev, ino, size, mtime), folder names)} for files indexed in folder.
+        """
+        rows = self.conn.execute("SELECT name, dev, ino, size, mtime, folders FROM files WHERE folder = ?",
+                                 (folder,))
+        return {name: ((dev, ino, size, mtime), json.loads(folders))
+                for name, dev, ino, size, mtime, folders in rows}
+
+    def add_file(self, folder, entry, folder_names):
+        """
+        Records a file that stays where it is and its folder names.
+        """
+        self._files.append((folder, entry.name, *self.file_key(entry.stat), json.dumps(folder_names)))
+
+    def add_move(self, entry, folder_names):
+        """
+        Records a planned move. Indexed at its destination by moved, or left out by skipped.
+        """
+        self._planned[entry.path] = (entry, json.dumps(folder_names))
+
+    def moved(self, source, dest_path):
+        if (planned := self._planned.pop(source, None)) is not None:
+            entry, folder_names = planned
+            self._moved.append((entry.root, entry.name))
+            self._files.append((os.path.dirname(dest_path), os.path.basename(dest_path),
+                                *self.file_key(entry.stat), folder_names))
+
+    def skipped(self, source):
+        # Not indexed. Its folder is listed again next sort so the file is sorted then.
+        if (planned := self._planned.pop(source, None)) is not None:
+            self._stale_dirs.add(planned[0].root)
+
+    def hashes(self, key):
+        """
+        (partial hash, full hash) of a file keyed by (dev, ino, size, mtime). None for hashes not stored or stale.
+        """
+        row = self.conn.execute("SELECT size, mtime, partial, full FROM hashes WHERE dev = ? AND ino = ?",
+                                key[:2]).fetchone()
+        if row is None or tuple(row[:2]) != tuple(key[2:]):
+            return None, None
+        return row[2], row[3]
+
+    def add_hashes(self, key, partial, full):
+        self._hashes.append((*key, partial, full))
+
+    def save_hashes(self):
+        # Saved right away. Hashes stay valid whether or not the sort finishes.
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)", self._hashes)
+        self._hashes = []
+
+    def save(self):
+        """
+        Saves the folders listed and files checked during the sort.
+        Only called for sorts that finish so that a canceled sort is re-checked next time.
+        """
+        seen_dirs = [row for row in self._seen_dirs if row[0] not in self._stale_dirs]
+        with self.conn:
+            self.conn.executemany("DELETE FROM files WHERE folder = ? AND name = ?", self._moved)
+            self.conn.executemany("DELETE FROM dirs WHERE path = ?", ((path,) for path in self._stale_dirs))
+            self.conn.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", seen_dirs)
+            self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", self._files)
+        self._seen_dirs, self._files, self._moved = [], [], []
+        self._planned, self._stale_dirs = {}, set()
+
+    def close(self):
+        self.conn.close()
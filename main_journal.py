@@ -0,0 +1,116 @@
+import os
+import json
+import time
+from datetime import datetime
+
+from main_scan import Scanner
+
+
+class MoveJournal:
+    """
+    Append-only record of the folders made and files moved by a sort. Used to revert the sort.
+    Written as JSON lines: ["dir", folder] for each folder made and ["move", source, destination] for each file
+    moved, in the order they happened. Lines are buffered and fsync'd every BATCH entries and on close.
+    One journal per sort kept in the sorted folder's state folder. Only the newest KEEP journals (reverted or not)
+    are kept. Older ones are removed as new ones are made.
+    """
+    BATCH = 256
+    FOLDER = 'journals'
+    EXT = '.jsonl'
+    # Added to a journal's name once reverted.
+    REVERTED = '.reverted'
+    KEEP = 20
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = None
+        self._pending = 0
+
+    @classmethod
+    def folder(cls, path):
+        return os.path.join(path, Scanner.STATE_DIR, cls.FOLDER)
+
+    @classmethod
+    def create(cls, path):
+        folder = cls.folder(path)
+        os.makedirs(folder, exist_ok=True)
+        name = f"sort{datetime.strftime(datetime.today(), '%m_%d_%y_%H_%M_%S')}_{time.time_ns() % 10 ** 9:09d}"
+        journal = cls(os.path.join(folder, name + cls.EXT))
+        journal._file = open(journal.file_path, 'a', encoding='utf-8')
+        cls.prune(path)
+        return journal
+
+    @classmethod
+    def prune(cls, path, keep=KEEP):
+        """
+        Removes all but the newest keep journals, reverted or not. keep=0 removes them all.
+        Returns the number removed.
+        """
+        folder = cls.folder(path)
+        try:
+            names = [name for name in os.listdir(folder) if name.endswith((cls.EXT, cls.EXT + cls.REVERTED))]
+        except FileNotFoundError:
+            return 0
+        file_paths = sorted((os.path.join(folder, name) for name in names), key=os.path.getmtime, reverse=True)
+        for file_path in file_paths[keep:]:
+            os.remove(file_path)
+        return len(file_paths[keep:])
+
+    @classmethod
+    def journals(cls, path):
+        """
+        Journals not yet reverted. Newest first.
+        """
+        try:
+            names = [name for name in os.listdir(cls.folder(path)) if name.endswith(cls.EXT)]
+        except FileNotFoundError:
+            return []
+        file_paths = [os.path.join(cls.folder(path), name) for name in names]
+        return [cls(file_path) for file_path in sorted(file_paths, key=os.path.getmtime, reverse=True)]
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._pending += 1
+        if self._pending >= self.BATCH:
+            self.sync()
+
+    def add_dir(self, folder):
+        self._write(['dir', folder])
+
+    def add_move(self, source, dest):
+        self._write(['move', source, dest])
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+            # Nothing was moved. No need to keep it.
+            if os.path.getsize(self.file_path) == 0:
+                os.remove(self.file_path)
+
+    def read(self):
+        """
+        Folders made and (source, destination) moves in the order they happened.
+        A line cut off by a crash is ignored.
+        """
+        dirs, moves = [], []
+        with open(self.file_path, encoding='utf-8') as journal_file:
+            for line in journal_file:
+                try:
+                    kind, *item = json.loads(line)
+                except ValueError:
+                    continue
+                if kind == 'dir':
+                    dirs.append(item[0])
+                else:
+                    moves.append(tuple(item))
+        return dirs, moves
+
+    def mark_reverted(self):
+        os.replace(self.file_path, self.file_path + self.REVERTED)
@@ -0,0 +1,95 @@
+import os
+import json
+
+
+class SortManifest:
+    """
+    Planned result of a sort. Holds every move as (source, destination folder, reason) and the folders to create.
+    File sizes are kept alongside the moves for progress reporting, and new names for files renamed on the way.
+    Duplicates to replace with hard links are kept as (target, path) and linked before any file is moved.
+    Nothing on disk changes until the manifest is applied with FileSort.apply_manifest.
+    Written as JSON lines: a header with the sorted path and folders, then one line per move.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.dirs = []
+        self.moves = []
+        self.sizes = {}
+        self.names = {}
+        self.links = []
+        self.total_size = 0
+        self._dir_set = set()
+
+    def add_dir(self, path):
+        if path not in self._dir_set:
+            self._dir_set.add(path)
+            self.dirs.append(path)
+
+    def add_move(self, source, dest, reason, size=0, name=None):
+        self.moves.append((source, dest, reason))
+        self.sizes[source] = size
+        if name is not None:
+            self.names[source] = name
+        self.total_size += size
+
+    def add_link(self, target, path):
+        self.links.append((target, path))
+
+    def revalidated(self):
+        """
+        Copy for applying a manifest written earlier. Moves whose source is gone or whose destination name is now
+        taken, and links whose files are gone, are dropped. Sizes are read again.
+        Returns the copy and the number of moves and links dropped.
+        """
+        manifest = SortManifest(self.path)
+        for path in self.dirs:
+            manifest.add_dir(path)
+        for target, path in self.links:
+            if os.path.isfile(target) and os.path.isfile(path):
+                manifest.add_link(target, path)
+        for source, dest, reason in self.moves:
+            name = self.names.get(source)
+            try:
+                size = os.lstat(source).st_size
+            except OSError:
+                continue
+            if not os.path.lexists(os.path.join(dest, name or os.path.basename(source))):
+                manifest.add_move(source, dest, reason, size, name)
+        return manifest, len(self) + len(self.links) - len(manifest) - len(manifest.links)
+
+    def write(self, file_path):
+        with open(file_path, 'w', encoding='utf-8') as manifest_file:
+            manifest_file.write(json.dumps({'path': self.path, 'dirs': self.dirs, 'links': self.links}) + '\n')
+            for move in self.moves:
+                name = [self.names[move[0]]] if move[0] in self.names else []
+                manifest_file.write(json.dumps([*move, self.sizes[move[0]], *name]) + '\n')
+        return file_path
+
+    @classmethod
+    def read(cls, file_path):
+        with open(file_path, encoding='utf-8') as manifest_file:
+            header = json.loads(manifest_file.readline())
+            manifest = cls(header['path'])
+            for path in header['dirs']:
+                manifest.add_dir(path)
+            for target, path in header.get('links', []):
+                manifest.add_link(target, path)
+            for line in manifest_file:
+                if line.strip():
+                    manifest.add_move(*json.loads(line))
+        return manifest
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __iter__(self):
+        return iter(self.moves)
+
+    def __str__(self):
+        lines = [f"{os.path.normpath(source)} -> {os.path.normpath(dest)} [{reason}]"
+                 for source, dest, reason in self.moves]
+        lines.extend(f"{os.path.normpath(path)} => {os.path.normpath(target)} [Duplicate]"
+                     for target, path in self.links)
+        return '\n'.join([f"Folders to create: {len(self.dirs)}", f"Files to move: {len(self.moves)}",
+                          f"Duplicates to link: {len(self.links)}", *lines])
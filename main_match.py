@@ -0,0 +1,121 @@
+import re
+from bisect import bisect_right
+from math import inf
+
+
+class KeywordMatcher:
+    """
+    Keyword groups compiled once into a single Aho-Corasick automaton.
+    Plain keywords are all found in one pass over a filename. Keywords using regex syntax fall back to
+    one precompiled pattern each.
+    Results are the same as searching every keyword of every group in order with re.search(keyword, re.I).
+    """
+    UNGROUPED = 'Ungrouped Keywords'
+    REGEX_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+    def __init__(self, keyword_settings):
+        # Unique keywords. Index in list is the keyword id.
+        self.keywords = []
+        kw_ids = {}
+        # (folder, [keyword ids]) in priority order.
+        self.groups = []
+        for folder, words in keyword_settings.items():
+            group_ids = []
+            for word in words:
+                if word not in kw_ids:
+                    kw_ids[word] = len(self.keywords)
+                    self.keywords.append(word)
+                group_ids.append(kw_ids[word])
+            self.groups.append((folder, group_ids))
+
+        # Index of every group a keyword appears in. Keywords listed twice are counted twice.
+        self.occurrences = [[] for _ in self.keywords]
+        # First named (non-ungrouped) group a keyword appears in.
+        self.first_group = [inf] * len(self.keywords)
+        # Position of a keyword in the ungrouped list. Keeps the order of the returned ungrouped keywords.
+        self.ungrouped_pos = [[] for _ in self.keywords]
+        self.ungrouped_group = inf
+
+        for group_ind, (folder, group_ids) in enumerate(self.groups):
+            if folder == self.UNGROUPED:
+                self.ungrouped_group = group_ind
+            for pos, kw_id in enumerate(group_ids):
+                self.occurrences[kw_id].append(group_ind)
+                if folder == self.UNGROUPED:
+                    self.ungrouped_pos[kw_id].append(pos)
+                else:
+                    self.first_group[kw_id] = min(self.first_group[kw_id], group_ind)
+
+        self.patterns = [(kw_id, re.compile(word, re.IGNORECASE)) for kw_id, word in enumerate(self.keywords)
+                         if self.REGEX_CHARS.intersection(word)]
+        self._build_automaton([(kw_id, word.lower()) for kw_id, word in enumerate(self.keywords)
+                               if not self.REGEX_CHARS.intersection(word)])
+
+    def _build_automaton(self, literals):
+        # Trie of goto transitions. Node 0 is the root.
+        self.goto, self.fail, self.out = [{}], [0], [[]]
+        for kw_id, word in literals:
+            node = 0
+            for char in word:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.out[node].append(kw_id)
+
+        # Breadth-first to set failure links. Outputs of the failure node are merged in.
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def find(self, text):
+        """
+        Set of keyword ids found in text.
+        """
+        hits = set()
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for char in text.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                hits.update(out[node])
+
+        for kw_id, pattern in self.patterns:
+            if pattern.search(text):
+                hits.add(kw_id)
+        return hits
+
+    def match(self, text):
+        """
+        Returns the folder result and the keyword counts for text.
+        Folder result is the first named group with a match, the list of matched ungrouped keywords if that group
+        is reached first, or None.
+        Counts are (keyword, times) for every group evaluated up to and including the one returned.
+        """
+        hits = self.find(text)
+        # Group where evaluation stops.
+        stop = min(min((self.first_group[kw_id] for kw_id in hits), default=inf), self.ungrouped_group)
+
+        counts = []
+        for kw_id in hits:
+            times = bisect_right(self.occurrences[kw_id], stop)
+            if times:
+                counts.append((self.keywords[kw_id], times))
+
+        if stop == inf:
+            return None, counts
+        folder, group_ids = self.groups[stop]
+        if folder == self.UNGROUPED:
+            positions = sorted(pos for kw_id in hits for pos in self.ungrouped_pos[kw_id])
+            return [self.keywords[group_ids[pos]] for pos in positions], counts
+        return folder, counts
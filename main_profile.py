@@ -0,0 +1,94 @@
+import json
+import time
+import threading
+from collections import defaultdict
+
+
+class StageProfiler:
+    """
+    Wall time, CPU time, and call counts for each stage of a sort (walk, stat, classification, folders, moves,
+    stats). Wall time well above CPU time means the stage is waiting on I/O (or on other threads).
+    Stages are timed by wrapping the functions that do the work. Disabled, wrap() returns the function itself so
+    the sort runs the same code with no overhead.
+    With a trace path, every call of a per-file stage is also written as a JSON line: [stage, path, seconds].
+    Stages can nest. Ex. walk includes stat.
+    """
+
+    def __init__(self, enabled=False, trace_path=None):
+        self.enabled = enabled or trace_path is not None
+        self.trace_path = trace_path
+        # Stage -> [calls, wall seconds, cpu seconds]
+        self.stages = defaultdict(lambda: [0, 0.0, 0.0])
+        self._lock = threading.Lock()
+        self._trace = open(trace_path, 'w', encoding='utf-8') if trace_path else None
+        self._start = (time.perf_counter(), time.process_time())
+
+    def _add(self, stage, wall, cpu, key=None):
+        with self._lock:
+            stats = self.stages[stage]
+            stats[0] += 1
+            stats[1] += wall
+            stats[2] += cpu
+            if key is not None and self._trace is not None:
+                self._trace.write(json.dumps([stage, key, round(wall, 6)]) + '\n')
+
+    def wrap(self, stage, func, per_file=False):
+        """
+        func timed under stage. per_file calls are traced with their first argument (a FileEntry or path).
+        """
+        if not self.enabled:
+            return func
+        add, perf_counter, thread_time = self._add, time.perf_counter, time.thread_time
+        trace = per_file and self._trace is not None
+
+        def timed(*args, **kwargs):
+            wall, cpu = perf_counter(), thread_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                key = getattr(args[0], 'path', args[0]) if trace else None
+                add(stage, perf_counter() - wall, thread_time() - cpu, key)
+
+        return timed
+
+    def wrap_iter(self, stage, iterable):
+        """
+        Items of iterable with the time taken to produce each one timed under stage.
+        """
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(stage, iter(iterable))
+
+    def _timed_iter(self, stage, iterator):
+        while True:
+            wall, cpu = time.perf_counter(), time.thread_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._add(stage, time.perf_counter() - wall, time.thread_time() - cpu)
+            yield item
+
+    def report(self):
+        """
+        Seconds per stage, and for the whole run. Wait is wall time not spent on the CPU.
+        """
+        wall, cpu = time.perf_counter() - self._start[0], time.process_time() - self._start[1]
+        stages = {stage: {'calls': calls, 'wall': round(stage_wall, 4), 'cpu': round(stage_cpu, 4),
+                          'wait': round(max(stage_wall - stage_cpu, 0.0), 4)}
+                  for stage, (calls, stage_wall, stage_cpu) in self.stages.items()}
+        return {'Stages': stages, 'Total': {'wall': round(wall, 4), 'cpu': round(cpu, 4)}}
+
+    def close(self):
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+    def __str__(self):
+        report = self.report()
+        lines = [f"{'Stage':<24}{'Calls':>10}{'Wall (s)':>12}{'CPU (s)':>12}{'Wait (s)':>12}"]
+        lines.extend(f"{stage:<24}{stats['calls']:>10,}{stats['wall']:>12.3f}{stats['cpu']:>12.3f}"
+                     f"{stats['wait']:>12.3f}" for stage, stats in report['Stages'].items())
+        lines.append(f"{'Total':<24}{'':>10}{report['Total']['wall']:>12.3f}{report['Total']['cpu']:>12.3f}")
+        return '\n'.join(lines)
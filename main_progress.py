@@ -0,0 +1,85 @@
+import time
+from collections import namedtuple
+
+
+class Progress(namedtuple('Progress', ['files', 'total', 'size', 'total_size', 'files_rate', 'bytes_rate', 'eta',
+                                       'phase'], defaults=('move',))):
+    """
+    One progress report. Rates are per second and eta is in seconds (None until a rate and total are known).
+    phase is 'plan' for files checked while planning and 'move' for files moved. A total of 0 while planning means
+    the number of files isn't known yet.
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def format_bytes(size):
+        for unit in ('B', 'KB', 'MB', 'GB'):
+            if size < 1024:
+                return f"{size:.1f} {unit}"
+            size /= 1024
+        return f"{size:.1f} TB"
+
+    @classmethod
+    def combine(cls, reports, elapsed):
+        """
+        One report for jobs running side by side. Rates are taken over the seconds elapsed since they all started.
+        While any job is still planning, only planning jobs are counted.
+        """
+        phase = 'plan' if any(report.phase == 'plan' for report in reports) else 'move'
+        reports = [report for report in reports if report.phase == phase]
+        files, total = sum(report.files for report in reports), sum(report.total for report in reports)
+        size = sum(report.size for report in reports)
+        files_rate = files / elapsed if elapsed > 0 else 0.0
+        bytes_rate = size / elapsed if elapsed > 0 else 0.0
+        eta = max(total - files, 0) / files_rate if files_rate > 0 and total else None
+        return cls(files, total, size, sum(report.total_size for report in reports), files_rate, bytes_rate, eta,
+                   phase)
+
+    def __str__(self):
+        eta = '--:--' if self.eta is None else time.strftime('%H:%M:%S', time.gmtime(self.eta))
+        if self.phase == 'plan':
+            total = f" / {self.total:,}" if self.total else ''
+            return f"{self.files:,}{total} files checked | {self.files_rate:,.1f} files/s | ETA {eta}"
+        return (f"{self.files:,} / {self.total:,} files | {self.files_rate:,.1f} files/s | "
+                f"{self.format_bytes(self.bytes_rate)}/s | ETA {eta}")
+
+
+class ProgressMeter:
+    """
+    Throttles progress reports to one per interval (seconds) no matter how fast files are checked or moved.
+    Keeps cross-thread signals and progress bar repaints from slowing down the sort.
+    The last report is always sent by finish().
+    """
+    INTERVAL = 0.1
+
+    def __init__(self, total, total_size, emit=None, interval=INTERVAL, phase='move'):
+        self.total = total
+        self.phase = phase
+        self.total_size = total_size
+        self.emit = emit
+        self.interval = interval
+        self.files = 0
+        self.size = 0
+        self.start = time.monotonic()
+        self._next = self.start + interval
+
+    def advance(self, size=0):
+        """
+        Counts one checked or moved file. Not thread-safe. Callers moving files concurrently hold a lock.
+        """
+        self.files += 1
+        self.size += size
+        if self.emit is not None and (now := time.monotonic()) >= self._next:
+            self._next = now + self.interval
+            self.emit(self.report(now))
+
+    def report(self, now=None):
+        elapsed = (now or time.monotonic()) - self.start
+        files_rate = self.files / elapsed if elapsed > 0 else 0.0
+        bytes_rate = self.size / elapsed if elapsed > 0 else 0.0
+        eta = max(self.total - self.files, 0) / files_rate if files_rate > 0 and self.total else None
+        return Progress(self.files, self.total, self.size, self.total_size, files_rate, bytes_rate, eta, self.phase)
+
+    def finish(self):
+        if self.emit is not None:
+            self.emit(self.report())
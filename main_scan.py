@@ -0,0 +1,195 @@
+import os
+import fnmatch
+import logging
+
+
+class FileEntry:
+    """
+    A file found while scanning. Holds the single stat result taken for the file so the folder functions
+    and the stats collector never have to go back to the disk for metadata.
+    """
+    __slots__ = ('name', 'root', 'path', 'stat')
+
+    def __init__(self, name, root, stat):
+        self.name = name
+        self.root = root
+        self.path = os.path.join(root, name)
+        self.stat = stat
+
+    @classmethod
+    def from_path(cls, path):
+        root, name = os.path.split(os.path.normpath(path))
+        return cls(name, root, os.stat(path))
+
+    def __repr__(self):
+        return f"FileEntry({self.path!r})"
+
+
+class IgnoreRules:
+    """
+    Folders to skip. Paths are resolved once to (st_dev, st_ino) so checking a folder is a set lookup with no stat
+    unless its inode matches. Items with glob characters are patterns matched against folder names, or full paths
+    if the pattern has a path separator. Ex. '*.git', 'node_modules', '*/build/*'
+    readdir gives a mount point the inode of the folder it covers, not of the mounted root. Ignored paths are also
+    matched by path, and with an ignored mount point every folder is stat'ed.
+    """
+    GLOB_CHARS = frozenset('*?[')
+
+    def __init__(self, ignore=None):
+        items = [ignore] if isinstance(ignore, str) else list(ignore or [])
+        self.keys = set()
+        self.paths = set()
+        self.patterns = []
+        self.mounts = False
+        for item in items:
+            if not item:
+                continue
+            if self.GLOB_CHARS.intersection(item):
+                self.patterns.append(os.path.normcase(item))
+                continue
+            try:
+                stat_obj = os.stat(item)
+            except OSError:
+                # Missing folders can't be walked into anyway.
+                continue
+            self.keys.add((stat_obj.st_dev, stat_obj.st_ino))
+            self.paths.add(os.path.normcase(os.path.abspath(item)))
+            self.mounts = self.mounts or os.path.ismount(item)
+        self.inodes = {ino for _, ino in self.keys}
+
+    def __bool__(self):
+        return bool(self.keys or self.patterns)
+
+    def _match_pattern(self, path):
+        name = os.path.normcase(os.path.basename(path))
+        return any(fnmatch.fnmatchcase(os.path.normcase(path) if os.sep in pattern or '/' in pattern else name,
+                                       pattern) for pattern in self.patterns)
+
+    def match(self, entry):
+        """
+        Checks a folder's os.DirEntry. Only stat'ed if its inode is one of the ignored ones or a mount point is
+        ignored.
+        """
+        if self.mounts or (self.inodes and entry.inode() in self.inodes):
+            stat_obj = entry.stat(follow_symlinks=False)
+            if (stat_obj.st_dev, stat_obj.st_ino) in self.keys:
+                logging.info(f'*Skipped ({entry.path}).')
+                return True
+        if self.paths and os.path.normcase(os.path.abspath(entry.path)) in self.paths:
+            logging.info(f'*Skipped ({entry.path}).')
+            return True
+        if self.patterns and self._match_pattern(entry.path):
+            logging.info(f'*Skipped ({entry.path}).')
+            return True
+        return False
+
+    def match_path(self, path):
+        try:
+            stat_obj = os.stat(path)
+        except OSError:
+            return False
+        return (stat_obj.st_dev, stat_obj.st_ino) in self.keys or bool(self.patterns and self._match_pattern(path))
+
+
+class Scanner:
+    # Folder holding the sorter's own files (index, manifests). Never walked.
+    STATE_DIR = '.filesorter'
+
+    @staticmethod
+    def walk(path, index=None, cancel=None, checkpoint=None, ignore=None, profiler=None):
+        """
+        Bottom-up walk over path built on os.scandir. Behaves like os.walk(path, topdown=False) but
+        yields (root, [FileEntry, ...]) with each file stat'ed exactly once.
+        Each directory is fully listed before its subdirectories are visited so folders made during a sort
+        are never walked.
+        With a FileIndex, folders whose mtime hasn't changed since the last sort aren't listed. Only their
+        subfolders are visited.
+        The walk stops visiting folders once cancel() returns True.
+        With a Checkpoint, files in folders already planned by an interrupted sort are skipped unless the folder
+        changed since.
+        Folders matching IgnoreRules are pruned before they are entered so nothing under them is listed.
+        With a StageProfiler, the time spent stat'ing files is timed apart from the rest of the walk.
+        """
+        root = os.path.normpath(path)
+        if ignore and ignore.match_path(root):
+            return
+        stat_entries = profiler.wrap('stat', Scanner.stat_entries) if profiler else Scanner.stat_entries
+        yield from Scanner._walk(root, index, cancel, checkpoint, ignore, stat_entries)
+
+    @staticmethod
+    def _walk(root, index, cancel, checkpoint, ignore, stat_entries):
+        if cancel is not None and cancel():
+            return
+        dir_mtime = None
+        if index is not None or checkpoint is not None:
+            try:
+                # Taken before listing so changes made while listing are seen next time.
+                dir_mtime = os.stat(root).st_mtime_ns
+            except OSError:
+                return
+        if index is not None and (subdirs := index.unchanged_dir(root, dir_mtime)) is not None:
+            for subdir in subdirs:
+                yield from Scanner._walk(subdir, index, cancel, checkpoint, ignore, stat_entries)
+            return
+        skip_files = checkpoint is not None and checkpoint.planned(root, dir_mtime)
+        if (listing := Scanner.list_dir(root, ignore, skip_files, stat_files=False)) is None:
+            return
+        entries, subdirs = listing
+        files = stat_entries(root, entries)
+
+        for subdir in subdirs:
+            yield from Scanner._walk(subdir, index, cancel, checkpoint, ignore, stat_entries)
+        if skip_files:
+            return
+        if index is not None:
+            index.seen_dir(root, dir_mtime, subdirs)
+        if checkpoint is not None:
+            checkpoint.listed(root, dir_mtime)
+        yield root, files
+
+    @staticmethod
+    def list_dir(root, ignore=None, skip_files=False, stat_files=True):
+        """
+        One listing of a folder. Returns (files, subfolder paths) or None if it can't be listed.
+        Files are FileEntry objects, or os.DirEntry objects still to be stat'ed without stat_files.
+        """
+        try:
+            with os.scandir(root) as it:
+                listing = list(it)
+        except OSError:
+            return None
+
+        files, subdirs = [], []
+        for entry in listing:
+            try:
+                if entry.is_dir():
+                    # Same as os.walk(followlinks=False). Symlinked dirs are not entered.
+                    if entry.is_symlink() or entry.name == Scanner.STATE_DIR:
+                        continue
+                    if not (ignore and ignore.match(entry)):
+                        subdirs.append(entry.path)
+                    continue
+                if not skip_files:
+                    files.append(FileEntry(entry.name, root, entry.stat()) if stat_files else entry)
+            except OSError:
+                # Broken symlinks or files removed mid-scan.
+                continue
+        return files, subdirs
+
+    @staticmethod
+    def stat_entries(root, entries):
+        """
+        FileEntry objects for os.DirEntry objects listed by list_dir without stat_files.
+        """
+        files = []
+        for entry in entries:
+            try:
+                files.append(FileEntry(entry.name, root, entry.stat()))
+            except OSError:
+                continue
+        return files
+
+    @staticmethod
+    def scan(path):
+        for _, files in Scanner.walk(path):
+            yield from files
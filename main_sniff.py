@@ -0,0 +1,96 @@
+class ContentSniffer:
+    """
+    Guesses a file's mimetype from its first bytes (magic signatures). Only used for files whose extension is
+    unknown to mimetypes. Ex. Extensionless files written by instruments.
+    At most SNIFF_SIZE bytes are read into one reused buffer. Results are cached by (st_dev, st_ino, st_mtime_ns)
+    so unchanged files are never read twice.
+    """
+    SNIFF_SIZE = 4096
+    # ((offset, signature), ...), mimetype. Checked in order. All parts must match.
+    SIGNATURES = (
+        (((0, b'%PDF-'),), 'application/pdf'),
+        (((0, b'\x89PNG\r\n\x1a\n'),), 'image/png'),
+        (((0, b'\xff\xd8\xff'),), 'image/jpeg'),
+        (((0, b'GIF87a'),), 'image/gif'),
+        (((0, b'GIF89a'),), 'image/gif'),
+        (((0, b'II*\x00'),), 'image/tiff'),
+        (((0, b'MM\x00*'),), 'image/tiff'),
+        (((0, b'RIFF'), (8, b'WEBP')), 'image/webp'),
+        (((0, b'RIFF'), (8, b'WAVE')), 'audio/x-wav'),
+        (((0, b'RIFF'), (8, b'AVI ')), 'video/x-msvideo'),
+        # 'BM' alone also starts text. Reserved bytes are zero and the DIB header is one of its known sizes.
+        (((0, b'BM'), (6, bytes(4)), (14, b'\x0c\x00\x00\x00')), 'image/bmp'),
+        (((0, b'BM'), (6, bytes(4)), (14, b'\x28\x00\x00\x00')), 'image/bmp'),
+        (((0, b'BM'), (6, bytes(4)), (14, b'\x6c\x00\x00\x00')), 'image/bmp'),
+        (((0, b'BM'), (6, bytes(4)), (14, b'\x7c\x00\x00\x00')), 'image/bmp'),
+        (((0, b'ID3'),), 'audio/mpeg'),
+        (((0, b'\xff\xfb'),), 'audio/mpeg'),
+        (((0, b'fLaC'),), 'audio/flac'),
+        (((0, b'OggS'),), 'audio/ogg'),
+        (((4, b'ftypM4A'),), 'audio/mp4'),
+        (((4, b'ftypqt'),), 'video/quicktime'),
+        # Still images in the same container as mp4. Checked before the generic ftyp.
+        (((4, b'ftypheic'),), 'image/heic'),
+        (((4, b'ftypheix'),), 'image/heic'),
+        (((4, b'ftypmif1'),), 'image/heif'),
+        (((4, b'ftypavif'),), 'image/avif'),
+        (((4, b'ftyp'),), 'video/mp4'),
+        (((0, b'\x1aE\xdf\xa3'),), 'video/webm'),
+        (((0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'),), 'application/msword'),
+        (((0, b'PK\x03\x04'),), 'application/zip'),
+        (((0, b'\x1f\x8b'),), 'application/gzip'),
+        (((0, b'BZh'),), 'application/x-bzip2'),
+        (((0, b'7z\xbc\xaf\x27\x1c'),), 'application/x-7z-compressed'),
+        (((0, b'Rar!\x1a\x07'),), 'application/vnd.rar'),
+        (((257, b'ustar'),), 'application/x-tar'),
+    )
+    # Office files are zip archives. Told apart by the folder names of their first entries.
+    ZIP_TYPES = ((b'word/', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+                 (b'xl/', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+                 (b'ppt/', 'application/vnd.openxmlformats-officedocument.presentationml.presentation'))
+    TEXT_TYPE = 'text/plain'
+
+    def __init__(self):
+        self._buffer = bytearray(self.SNIFF_SIZE)
+        self._cache = {}
+
+    def mimetype(self, entry):
+        """
+        Mimetype of a FileEntry from its content. None if it isn't recognized.
+        """
+        stat_obj = entry.stat
+        key = (stat_obj.st_dev, stat_obj.st_ino, stat_obj.st_mtime_ns)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+
+        try:
+            with open(entry.path, 'rb', buffering=0) as file:
+                size = file.readinto(self._buffer)
+        except OSError:
+            size = 0
+        mimetype = self._cache[key] = self._match(size) if size else None
+        return mimetype
+
+    def _match(self, size):
+        # Bytes past size are left over from the last file. Never looked at.
+        buffer = self._buffer
+        for parts, mimetype in self.SIGNATURES:
+            if all(buffer.startswith(signature, offset, size) for offset, signature in parts):
+                if mimetype == 'application/zip':
+                    for name, zip_type in self.ZIP_TYPES:
+                        if buffer.find(name, 0, size) != -1:
+                            return zip_type
+                return mimetype
+
+        head = bytes(buffer[:size])
+        if b'\x00' in head:
+            return None
+        try:
+            head.decode('utf-8')
+        except UnicodeDecodeError as err:
+            # A character cut off at the end of the buffer is still text.
+            if err.start < size - 3:
+                return None
+        return self.TEXT_TYPE
@@ -1,21 +1,50 @@
 import os
+from array import array
 from datetime import datetime
-import pandas as pd
-import matplotlib.pyplot as plt
-from itertools import accumulate
-from collections import defaultdict, Counter
 
-from gen_tools import Tools
+from gen_tools import LazyModule
+
+# Loaded on first use so sorting alone never pays for them.
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+plt = LazyModule('matplotlib.pyplot')
+tz = LazyModule('dateutil.tz')
+
 # pd.set_option("display.max_rows", None, "display.max_columns", None)
 
 
 class FileDf:
+    TIME_COLUMNS = ('Time Last Accessed', 'Time Last Modified', 'Time Created')
 
     def __init__(self):
-        self.df = pd.DataFrame(columns=['Filename',
-                                        'Folder',
-                                        'Size',
-                                        'Time Last Accessed', 'Time Last Modified', 'Time Created'])
+        # Append-only columns. Sizes kept as bytes and times as epoch seconds.
+        # The dataframe is only built when first asked for.
+        self.columns = {'Filename': [],
+                        'Extension': [],
+                        'Folder': [],
+                        'Size': array('q'),
+                        **{time_col: array('d') for time_col in self.TIME_COLUMNS}}
+        self._df = None
+
+    @property
+    def df(self):
+        if self._df is None:
+            self._df = self.build_df()
+        return self._df
+
+    def build_df(self):
+        sizes = pd.Series(self.columns['Size'], dtype='int64')
+        df = pd.DataFrame({'Filename': self.columns['Filename'],
+                           'Extension': pd.Series(self.columns['Extension'], dtype='category'),
+                           'Folder': self.columns['Folder'],
+                           'Size': (sizes / (1024 ** 2)).round(2),
+                           # Epoch seconds to local time. Same as datetime.fromtimestamp.
+                           **{time_col: pd.to_datetime(pd.Series(self.columns[time_col], dtype='float64'),
+                                                       unit='s', utc=True).dt.tz_convert(tz.tzlocal()).dt.tz_localize(None)
+                              for time_col in self.TIME_COLUMNS}})
+        # Rows enumerated from 1.
+        df.index = pd.RangeIndex(1, len(df) + 1)
+        return df
 
     @staticmethod
     def convert_time(timestamp):
@@ -26,15 +55,19 @@ class FileDf:
         sizes = {'KB': 1, 'MB': 2, 'GB': 3}
         return round(time_bytes / (1024 ** sizes.get(size, 2)), 2)
 
-    def store_file_properties(self, file_path, folder):
-        # TODO: Add reset to df on multiple sorts.
-        stat_obj = os.stat(file_path)
-        # Enumerates df entries. If no max (start of df) start at 1. Else add 1 on to it.
-        self.df.loc[1 if pd.isnull(self.df.index.max()) else self.df.index.max() + 1] = \
-            (os.path.split(file_path)[-1],  # file
-             folder,  # folder
-             self.convert_bytes(stat_obj[6]),  # file size
-             *[self.convert_time(timestamp) for timestamp in stat_obj[7:]])  # times
+    def store_file_properties(self, entry, folder):
+        # Stat result cached on the FileEntry during the scan.
+        stat_obj = entry.stat
+        columns = self.columns
+        columns['Filename'].append(entry.name)
+        columns['Extension'].append(os.path.splitext(entry.name)[1])
+        columns['Folder'].append(folder)
+        columns['Size'].append(stat_obj.st_size)
+        columns['Time Last Accessed'].append(stat_obj.st_atime)
+        columns['Time Last Modified'].append(stat_obj.st_mtime)
+        columns['Time Created'].append(stat_obj.st_ctime)
+        # Rebuild on next access.
+        self._df = None
 
 
 class Plotter:
@@ -42,10 +75,37 @@ class Plotter:
     Have open a QMessageBox/QWidget with options to chose which plot to show.
     """
 
+    # Extension the same as os.path.splitext. Leading dots (hidden files) are not an extension.
+    EXT_PATTERN = r'(?s)^\.*[^.].*(\.[^.]*)$'
+
     def __init__(self, df, counter, total_chkd):
         self.df = df
         self.counter = {k: dict(v) for k, v in counter.items()}
         self.total_chkd = total_chkd
+        self._stats = {}
+
+    def stats(self, time_mode='Time Last Modified', time_bucket='M'):
+        """
+            All statistics used by the charts, computed once with vectorized operations over the metadata table.
+            time_bucket is a pandas period alias. Ex. 'D', 'M', 'Y'
+        """
+        if (time_mode, time_bucket) in self._stats:
+            return self._stats[time_mode, time_bucket]
+
+        df = self.df
+        if 'Extension' in df:
+            ext = df['Extension']
+        else:
+            ext = df['Filename'].str.extract(self.EXT_PATTERN, expand=False).fillna('')
+        times = df[time_mode].to_numpy()
+        by_time = np.argsort(times, kind='stable')
+        stats = {'File Extensions': ext.value_counts(sort=True).loc[lambda counts: counts > 0],
+                 # Prefix sum of size ordered by time.
+                 'Cumulative Size': pd.Series(np.cumsum(df['Size'].to_numpy()[by_time]), index=times[by_time]),
+                 'Folder Size': df.groupby('Folder')['Size'].agg(['count', 'sum']),
+                 'Time Buckets': df.groupby(df[time_mode].dt.to_period(time_bucket))['Size'].agg(['count', 'sum'])}
+        self._stats[time_mode, time_bucket] = stats
+        return stats
 
     @staticmethod
     def val_to_str(vals):
@@ -55,6 +115,11 @@ class Plotter:
 
         return converter
 
+    @staticmethod
+    def show():
+        plt.tight_layout()
+        plt.show()
+
     @staticmethod
     def annotate_bar(axes):
         for item in axes.patches:
@@ -68,45 +133,39 @@ class Plotter:
             Allow sorting by file type
         """
         # TODO: Take current Time setting.
-        df = self.df.sort_values(time_mode)
-        # Add column with prefix sum
-        df.loc[:, 'Size'] = list(accumulate(list(df['Size'])))
-
-        df.plot.line(x=time_mode, y='Size', xlabel='Time', ylabel='Size (MB)')
-        plt.tight_layout()
-        plt.show()
+        self.stats(time_mode)['Cumulative Size'].plot.line(xlabel='Time', ylabel='Size (MB)')
+        self.show()
 
     def file_ext(self):
         """
             Plot pie/bar - file extensions
         """
+        self.plot_counter(self.stats()['File Extensions'].to_dict(), 'pie', ylab='File Extensions')
 
-        all_ext = [os.path.splitext(item)[1] for item in self.df['Filename']]
-        ext_types = set(all_ext)
-        ext_counts = [all_ext.count(ext) for ext in ext_types]
-        ext_total = {ext: num for ext, num in zip(ext_types, ext_counts)}
+    def folder_size(self):
+        """
+            Plot bar - total size of files in each folder they were found in.
+        """
+        self.plot_counter(self.stats()['Folder Size']['sum'].round(2).to_dict(), 'bar',
+                          xlab='Folder Name', ylab='Size (MB)')
 
-        self.plot_counter(ext_total, 'pie', ylab='File Extensions')
+    def time_dist(self, time_mode='Time Last Modified', time_bucket='M'):
+        """
+            Plot bar - number of files in each time bucket.
+        """
+        time_counts = self.stats(time_mode, time_bucket)['Time Buckets']['count']
+        self.plot_counter({str(period): num for period, num in time_counts.items()}, 'bar',
+                          xlab='Time', ylab='Number of Files')
 
     """
     Post-sort data.
     """
 
-    def file_dist(self, main_path):
+    def file_dist(self, dir_file_count):
         """
             Plot bar - file distribution in folders.
-            Take first nested folder among subfolders
+            dir_file_count is files per top-level folder, tallied by FileSort during the sort.
         """
-        dir_file_count = Counter()
-        for root, dirs, files in os.walk(main_path, topdown=True):
-            if root != main_path:
-                # Get base path by removing main_path from root and taking first folder after.
-                base_path = Tools.get_base_folder(main_path, root)
-                dir_file_count[base_path] += len(files)
-
-        # Convert to dict to avoid matplotlib errors with Counter object.
-        dir_file_count = dict(dir_file_count)
-
         self.plot_counter(dir_file_count, 'bar', xlab='Folder Name', ylab='Number of Files')
 
     def file_types(self):
@@ -140,7 +199,6 @@ class Plotter:
             ax = df.plot.bar(xlabel=xlab, ylabel=ylab)
             self.annotate_bar(ax)
         elif graph_type == 'pie':
-            df.plot.pie(ylabel=ylab, startangle=90, autopct=self.val_to_str(categ_counts))
+            df.plot.pie(y=ylab, ylabel=ylab, startangle=90, autopct=self.val_to_str(categ_counts))
 
-        plt.tight_layout()
-        plt.show()
\ No newline at end of file
+        self.show()
\ No newline at end of file
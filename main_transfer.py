@@ -0,0 +1,127 @@
+import os
+import sys
+import errno
+import shutil
+import ctypes
+
+
+class Transfer:
+    """
+    Moves files the cheapest way possible.
+    Same device (st_dev): a single rename with no existence checks or copy attempts. On Linux, renameat2 with
+    RENAME_NOREPLACE refuses to replace an existing file. Filesystems without it get a plain os.rename.
+    Names are already free after planning.
+    Different devices: a kernel-side copy (copy_file_range, then sendfile) with metadata preserved before the
+    source is removed.
+    Device numbers are looked up once per folder and cached.
+    A taken name raises FileExistsError. Neither a copy nor renameat2 replaces an existing file.
+    """
+    # Bytes per kernel copy call.
+    CHUNK = 64 * 1024 * 1024
+    # Errors where a kernel copy isn't supported and the next method should be tried.
+    UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EBADF, errno.EOPNOTSUPP, errno.ENOTSUP}
+    # Errors where renameat2 or its flag isn't supported (ex. older kernels, some network filesystems).
+    NO_RENAMEAT2 = {errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP}
+    RENAME_NOREPLACE = 1
+    AT_FDCWD = -100
+    # libc renameat2. False until looked up. None where unavailable.
+    _renameat2 = False
+
+    def __init__(self):
+        self._devs = {}
+        # Devices whose filesystem refused renameat2. Renamed with os.rename without trying again.
+        self._plain_devs = set()
+
+    @classmethod
+    def _libc_renameat2(cls):
+        if cls._renameat2 is False:
+            cls._renameat2 = None
+            if sys.platform.startswith('linux'):
+                try:
+                    # Symbols of the running process, libc included. No library search.
+                    renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+                except (OSError, AttributeError):
+                    return None
+                renameat2.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint)
+                renameat2.restype = ctypes.c_int
+                cls._renameat2 = renameat2
+        return cls._renameat2
+
+    def device(self, folder):
+        try:
+            return self._devs[folder]
+        except KeyError:
+            dev = self._devs[folder] = os.stat(folder).st_dev
+            return dev
+
+    def move(self, source, dest_dir, name=None):
+        dest = os.path.join(dest_dir, name or os.path.basename(source))
+        if (dev := self.device(os.path.dirname(source))) == self.device(dest_dir):
+            self.rename(source, dest, dev)
+        else:
+            self.copy(source, dest)
+            os.unlink(source)
+        return dest
+
+    def rename(self, source, dest, dev=None):
+        # os.rename silently replaces dest on POSIX. On Windows it already refuses.
+        if dev not in self._plain_devs and (renameat2 := self._libc_renameat2()) is not None:
+            if renameat2(self.AT_FDCWD, os.fsencode(source), self.AT_FDCWD, os.fsencode(dest),
+                         self.RENAME_NOREPLACE) == 0:
+                return
+            if (err := ctypes.get_errno()) not in self.NO_RENAMEAT2:
+                # FileExistsError for a taken name.
+                raise OSError(err, os.strerror(err), source, None, dest)
+            self._plain_devs.add(dev)
+        os.rename(source, dest)
+
+    @classmethod
+    def copy(cls, source, dest):
+        with open(source, 'rb') as src_file:
+            size = os.fstat(src_file.fileno()).st_size
+            # Never overwrite an existing file.
+            dst_fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+            try:
+                with open(dst_fd, 'wb') as dst_file:
+                    cls._copy_data(src_file.fileno(), dst_file.fileno(), size)
+                    # The source is only removed after a full copy.
+                    if (copied := os.fstat(dst_file.fileno()).st_size) < size:
+                        raise OSError(errno.EIO, f"Short copy ({copied} of {size} bytes)", dest)
+            except BaseException:
+                os.unlink(dest)
+                raise
+        shutil.copystat(source, dest)
+
+    @classmethod
+    def _kernel_copies(cls):
+        if hasattr(os, 'copy_file_range'):
+            yield lambda src_fd, dst_fd, offset, count: os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+        if hasattr(os, 'sendfile'):
+            def sendfile(src_fd, dst_fd, offset, count):
+                os.lseek(dst_fd, offset, os.SEEK_SET)
+                return os.sendfile(dst_fd, src_fd, offset, count)
+            yield sendfile
+
+    @classmethod
+    def _copy_data(cls, src_fd, dst_fd, size):
+        offset = 0
+        for kernel_copy in cls._kernel_copies():
+            try:
+                while offset < size:
+                    if (sent := kernel_copy(src_fd, dst_fd, offset, min(cls.CHUNK, size - offset))) == 0:
+                        # Stopped early (ex. some FUSE or network filesystems). Next method picks up from here.
+                        break
+                    offset += sent
+                if offset >= size:
+                    return
+            except OSError as err:
+                if err.errno not in cls.UNSUPPORTED:
+                    raise
+
+        # No kernel copy available. Plain read/write from where the last method stopped.
+        os.lseek(src_fd, offset, os.SEEK_SET)
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        while chunk := os.read(src_fd, 1024 * 1024):
+            view = memoryview(chunk)
+            while view:
+                view = view[os.write(dst_fd, view):]
@@ -0,0 +1,210 @@
+import os
+import stat
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+
+from main_scan import FileEntry, Scanner
+
+
+class Inotify:
+    """
+    Minimal ctypes binding of Linux inotify for a single folder.
+    """
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    # struct inotify_event {int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[];}
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify not available.")
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed.")
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"Unable to watch ({path}).")
+
+    def read(self, timeout):
+        """
+        Names of files and folders with activity. None if events were lost and the folder must be listed again.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        names, offset = set(), 0
+        while offset < len(data):
+            _, mask, _, name_len = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b'\0'))
+            offset += name_len
+            if mask & self.IN_Q_OVERFLOW:
+                return None
+            # Folders only report being made or moved in. Activity inside them isn't watched.
+            if name:
+                names.add(name)
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Poller:
+    """
+    Fallback when inotify isn't available. Lists only the watched folder (no walk) every interval and reports
+    files and folders that are new or whose size or mtime changed.
+    """
+
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self.last = self._listing()
+
+    def _listing(self):
+        listing = {}
+        with os.scandir(self.path) as it:
+            for entry in it:
+                try:
+                    if entry.is_file() or entry.is_dir(follow_symlinks=False):
+                        stat_obj = entry.stat()
+                        listing[entry.name] = (stat_obj.st_size, stat_obj.st_mtime_ns)
+                except OSError:
+                    continue
+        return listing
+
+    def read(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        current = self._listing()
+        names = {name for name, key in current.items() if self.last.get(name) != key}
+        self.last = current
+        return names
+
+    def close(self):
+        pass
+
+
+class SortWatcher:
+    """
+    Long-running sort of a drop folder. Files are sorted as they arrive using the same sort settings as
+    FileSort.sort_files, with no periodic walks of the tree.
+    A file is only sorted once it has had no activity for settle seconds so files still being written are left
+    alone. Only the top of the folder is watched; sorted folders are not.
+    Folders made or moved into the folder are walked once settled and their files sorted. Folders the watcher sorts
+    files into are left alone.
+    """
+
+    def __init__(self, sorter, sort_settings, settle=2.0, in_place=False, workers=1, use_inotify=True,
+                 poll_interval=1.0, sniff=False):
+        self.sorter = sorter
+        self.sort_settings = sort_settings
+        self.sniff = sniff
+        self.settle = settle
+        self.in_place = in_place
+        self.workers = workers
+        self.path = os.path.normpath(sorter.path)
+        self.source = None
+        if use_inotify:
+            try:
+                self.source = Inotify(self.path)
+            except (OSError, AttributeError) as err:
+                logging.info(f"Inotify unavailable ({err}). Polling ({self.path}) instead.")
+        if self.source is None:
+            self.source = Poller(self.path, poll_interval)
+        # File or folder name -> time of last activity.
+        self.pending = {}
+        # Top-level folders files were sorted into. Never walked as dropped folders.
+        self.dest_dirs = {Scanner.STATE_DIR}
+
+    def _pend_all(self, dirs=False):
+        # Folders are only pended when catching up on lost events. Ones there at the start are left alone.
+        now = time.monotonic()
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.is_file() or (dirs and entry.is_dir(follow_symlinks=False) and
+                                       entry.name not in self.dest_dirs):
+                    self.pending[entry.name] = now
+
+    def _dropped_files(self, name):
+        """
+        FileEntry objects of every file in a dropped folder. None if a file changed within settle seconds and the
+        folder is still being copied.
+        """
+        newest, entries = time.time() - self.settle, []
+        for _, files in Scanner.walk(os.path.join(self.path, name), cancel=lambda: self.sorter._shutdown == 1):
+            for entry in files:
+                if entry.stat.st_mtime > newest:
+                    return None
+                entries.append(entry)
+        return entries
+
+    def _add_dest_dirs(self, manifest):
+        for dest in (*manifest.dirs, *(dest for _, dest, _ in manifest)):
+            top = os.path.relpath(dest, self.path).split(os.sep)[0]
+            if top not in (os.curdir, os.pardir):
+                self.dest_dirs.add(top)
+
+    def _sort_ready(self):
+        now = time.monotonic()
+        ready = [name for name, last in self.pending.items() if now - last >= self.settle]
+        entries = []
+        for name in ready:
+            del self.pending[name]
+            try:
+                entry = FileEntry.from_path(os.path.join(self.path, name))
+            except OSError:
+                # Removed or renamed before it settled.
+                continue
+            if stat.S_ISREG(entry.stat.st_mode):
+                entries.append(entry)
+            elif stat.S_ISDIR(entry.stat.st_mode) and name not in self.dest_dirs and not os.path.islink(entry.path):
+                if (files := self._dropped_files(name)) is None:
+                    self.pending[name] = now
+                else:
+                    entries.extend(files)
+        if not entries:
+            return None
+
+        manifest = self.sorter.plan_entries(entries, self.sort_settings, in_place=self.in_place, sniff=self.sniff)
+        self._add_dest_dirs(manifest)
+        self.sorter.apply_manifest(manifest, workers=self.workers)
+        for source, dest, reason in manifest:
+            logging.info(f"({os.path.basename(source)}) sorted into ({dest}) [{reason}]")
+        return manifest
+
+    def run(self, stop=None, on_sort=None):
+        """
+        Sorts until stop() returns True or the sorter is shut down.
+        Files already in the folder are sorted first. on_sort is called with each applied SortManifest.
+        """
+        self._pend_all()
+        try:
+            while self.sorter._shutdown == 0 and not (stop and stop()):
+                # Wake up when the next pending file settles.
+                now = time.monotonic()
+                timeout = max(0.05, min(last + self.settle - now for last in self.pending.values())) \
+                    if self.pending else 1.0
+                if (names := self.source.read(timeout)) is None:
+                    # Events lost. List the folder once to catch up.
+                    self._pend_all(dirs=True)
+                else:
+                    now = time.monotonic()
+                    for name in names:
+                        self.pending[name] = now
+                if (manifest := self._sort_ready()) and on_sort:
+                    on_sort(manifest)
+        finally:
+            self.source.close()
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from main import FolderFxs
+from main_scan import FileEntry
+
+ARCHIVES = {'zip': b'PK\x03\x04' + bytes(26), 'gzip': b'\x1f\x8b\x08\x00', 'bzip2': b'BZh91AY&SY',
+            '7z': b'7z\xbc\xaf\x27\x1c\x00\x04', 'rar': b'Rar!\x1a\x07\x00', 'tar': bytes(257) + b'ustar\x0000'}
+FILE_TYPES = ['Spreadsheet', 'Word Document', 'Presentation', 'PDF', 'Audio', 'Video', 'Image', 'Text', 'Archive']
+
+
+def folder_fxs(sniff=False):
+    return FolderFxs({'File Type': (1, {'File Types': FILE_TYPES})}, sniff=sniff)
+
+
+@pytest.mark.parametrize('name', ARCHIVES)
+def test_sniffed_archives_are_archives(tmp_path, name):
+    path = tmp_path / f"{name}.unknownext"
+    path.write_bytes(ARCHIVES[name])
+    assert folder_fxs(sniff=True)._file_folder(FileEntry.from_path(os.fspath(path))) == 'Archive'
+
+
+@pytest.mark.parametrize('ext', ['.zip', '.7z', '.tar', '.rar'])
+def test_archive_extensions_are_archives(ext):
+    assert folder_fxs()._classify_ext(ext) == 'Archive'
+
+
+def test_pdf():
+    assert folder_fxs()._classify_ext('.pdf') == 'PDF'
+
+
+BMP_HEADER = b'BM' + (70).to_bytes(4, 'little') + bytes(4) + (54).to_bytes(4, 'little') + (40).to_bytes(4, 'little')
+SNIFFED = {'bmp': (BMP_HEADER + bytes(16), 'Image'), 'bmw': (b'BMW fleet report for the quarter\n', 'Text'),
+           'heic': (bytes(3) + b'\x18ftypheic' + bytes(8), 'Image'),
+           'heif': (bytes(3) + b'\x18ftypmif1' + bytes(8), 'Image'),
+           'avif': (bytes(3) + b'\x18ftypavif' + bytes(8), 'Image'),
+           'mp4': (bytes(3) + b'\x18ftypisom' + bytes(8), 'Video')}
+
+
+@pytest.mark.parametrize('name', SNIFFED)
+def test_sniffed_types(tmp_path, name):
+    content, categ = SNIFFED[name]
+    path = tmp_path / f"{name}.unknownext"
+    path.write_bytes(content)
+    assert folder_fxs(sniff=True)._file_folder(FileEntry.from_path(os.fspath(path))) == categ
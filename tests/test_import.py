@@ -0,0 +1,25 @@
+import os
+import sys
+import json
+import subprocess
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Seconds. Importing main took ~0.07 s without the heavy modules and over 1 s with them.
+IMPORT_BUDGET = 0.5
+HEAVY_MODULES = ('pandas', 'matplotlib', 'PyQt5')
+
+CHECK = f"""
+import sys, json, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed': elapsed, 'loaded': [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+"""
+
+
+def test_main_import_is_light():
+    # A fresh interpreter so modules imported by other tests don't count.
+    result = subprocess.run([sys.executable, '-c', CHECK], cwd=REPO, capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report['loaded'] == []
+    assert report['elapsed'] < IMPORT_BUDGET